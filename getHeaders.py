@@ -1,5 +1,5 @@
 from io import BytesIO
-from src.block import Block, GENESIS_BLOCK, LOWEST_BITS
+from src.block import Block, GENESIS_BLOCK, LOWEST_BITS, check_pow_many
 from src.network import SimpleNode, GetHeadersMessage, HeadersMessage
 from src.helper import calculate_new_bits
 
@@ -14,8 +14,9 @@ def main():
     getHeaders = GetHeadersMessage(start_block=previous.hash())  
     node.send(getHeaders)
     headers = node.wait_for(HeadersMessage)
-    for header in headers.blocks:
-      if not header.check_pow():
+    pow_ok = check_pow_many(headers.raw)
+    for header, ok in zip(headers.blocks, pow_ok):
+      if not ok:
         raise RuntimeError(f'Bad PoW at block {count}')
       if header.prev_block != previous.hash():
         raise RuntimeError(f'Discountinous block at {count}')
@@ -0,0 +1,197 @@
+import hashlib
+import hmac
+
+from .helper import (
+  decode_base58_checksum,
+  encode_base58_checksum,
+  hash160,
+)
+from .secp256k1 import (
+  G,
+  GeneratorTable,
+  N,
+  PrivateKey,
+  S256Point,
+  jacobian_add,
+  to_jacobian,
+)
+
+HARDENED = 2**31
+MAINNET_PRIVATE = bytes.fromhex('0488ade4')
+MAINNET_PUBLIC = bytes.fromhex('0488b21e')
+TESTNET_PRIVATE = bytes.fromhex('04358394')
+TESTNET_PUBLIC = bytes.fromhex('043587cf')
+
+def parse_path(path):
+  '''Turns a path like "m/44'/0'/0'/0/5" into a tuple of child indexes.
+  Hardened steps can be written with ' or h.'''
+  parts = path.strip().split('/')
+  if parts[0] != 'm':
+    raise ValueError(f'path must start with m: {path}')
+  result = []
+  for part in parts[1:]:
+    hardened = part[-1:] in ("'", 'h', 'H')
+    if hardened:
+      part = part[:-1]
+    if not part.isdigit() or int(part) >= HARDENED:
+      raise ValueError(f'bad path component: {part}')
+    result.append(int(part) + HARDENED if hardened else int(part))
+  return tuple(result)
+
+class ExtendedKey:
+  '''BIP32 extended key. Holds a secret for xprv keys; secret is None
+  for xpub keys. Intermediate nodes reached through derive() are memoized
+  in children, so sibling derivations reuse their parent.'''
+  def __init__(self, chain_code, secret=None, point=None, depth=0,
+    parent_fingerprint=b'\x00\x00\x00\x00', child_number=0, testnet=False):
+    if secret is None and point is None:
+      raise ValueError('an extended key needs a secret or a point')
+    self.chain_code = chain_code
+    self.secret = secret
+    self.point = point if point is not None else secret * G
+    self.depth = depth
+    self.parent_fingerprint = parent_fingerprint
+    self.child_number = child_number
+    self.testnet = testnet
+    self.children = {}
+
+  def __repr__(self):
+    return self.xprv() if self.is_private() else self.xpub()
+
+  @classmethod
+  def from_seed(cls, seed, testnet=False):
+    i = hmac.new(b'Bitcoin seed', seed, hashlib.sha512).digest()
+    secret = int.from_bytes(i[:32], 'big')
+    if secret == 0 or secret >= N:
+      raise ValueError('invalid master key, use another seed')
+    return cls(i[32:], secret=secret, testnet=testnet)
+
+  def is_private(self):
+    return self.secret is not None
+
+  def private_key(self):
+    if not self.is_private():
+      raise ValueError('public extended key has no private key')
+    return PrivateKey(self.secret)
+
+  def fingerprint(self):
+    return hash160(self.point.sec())[:4]
+
+  def neuter(self):
+    '''Returns the public (xpub) version of this key'''
+    return self.__class__(
+      self.chain_code, point=self.point, depth=self.depth,
+      parent_fingerprint=self.parent_fingerprint,
+      child_number=self.child_number, testnet=self.testnet,
+    )
+
+  def tweak(self, index):
+    '''Returns the HMAC-SHA512 output (I_L, chain code) for child index'''
+    if index >= HARDENED:
+      if not self.is_private():
+        raise ValueError('cannot derive a hardened child from a public key')
+      data = b'\x00' + self.secret.to_bytes(32, 'big')
+    else:
+      data = self.point.sec()
+    i = hmac.new(self.chain_code, data + index.to_bytes(4, 'big'), hashlib.sha512).digest()
+    tweak = int.from_bytes(i[:32], 'big')
+    if tweak >= N:
+      raise ValueError(f'invalid child {index}, use the next index')
+    return tweak, i[32:]
+
+  def child(self, index):
+    '''Derives a single child (CKDpriv or CKDpub)'''
+    return self.derive_range(index, 1)[0]
+
+  def derive(self, path):
+    '''Derives the key at path ("m/44'/0'/0'/0/5" or a tuple of indexes)
+    relative to this key. Every intermediate node is memoized.'''
+    if isinstance(path, str):
+      path = parse_path(path)
+    node = self
+    for index in path[:-1]:
+      child = node.children.get(index)
+      if child is None:
+        child = node.child(index)
+        node.children[index] = child
+      node = child
+    if not path:
+      return node
+    return node.child(path[-1])
+
+  def derive_range(self, start, count):
+    '''Derives children start .. start+count-1. Every child point is
+    I_L * G + K_par from the generator table, and all of them are
+    converted to affine with one batch inversion.'''
+    parent = to_jacobian(self.point)
+    fingerprint = self.fingerprint()
+    tweaks = []
+    points = []
+    for index in range(start, start + count):
+      tweak, chain_code = self.tweak(index)
+      point = jacobian_add(GeneratorTable.multiply(tweak), parent)
+      if point[2] == 0:
+        raise ValueError(f'invalid child {index}, use the next index')
+      tweaks.append((index, tweak, chain_code))
+      points.append(point)
+    result = []
+    for (index, tweak, chain_code), point in zip(tweaks, S256Point.normalize_batch(points)):
+      secret = (tweak + self.secret) % N if self.is_private() else None
+      result.append(self.__class__(
+        chain_code, secret=secret, point=point, depth=self.depth + 1,
+        parent_fingerprint=fingerprint, child_number=index, testnet=self.testnet,
+      ))
+    return result
+
+  def clear_cache(self):
+    self.children = {}
+
+  def serialize(self, private=True):
+    '''Returns the 78-byte BIP32 serialization'''
+    if private and not self.is_private():
+      raise ValueError('public extended key has no private key')
+    if private:
+      version = TESTNET_PRIVATE if self.testnet else MAINNET_PRIVATE
+      key = b'\x00' + self.secret.to_bytes(32, 'big')
+    else:
+      version = TESTNET_PUBLIC if self.testnet else MAINNET_PUBLIC
+      key = self.point.sec()
+    result = version
+    result += bytes([self.depth])
+    result += self.parent_fingerprint
+    result += self.child_number.to_bytes(4, 'big')
+    result += self.chain_code
+    result += key
+    return result
+
+  def xprv(self):
+    return encode_base58_checksum(self.serialize(private=True))
+
+  def xpub(self):
+    return encode_base58_checksum(self.serialize(private=False))
+
+  @classmethod
+  def parse(cls, s):
+    '''Parses an xprv/xpub/tprv/tpub string'''
+    raw = decode_base58_checksum(s)
+    if len(raw) != 78:
+      raise ValueError(f'bad extended key length: {len(raw)}')
+    version = raw[:4]
+    if version not in (MAINNET_PRIVATE, MAINNET_PUBLIC, TESTNET_PRIVATE, TESTNET_PUBLIC):
+      raise ValueError(f'unknown extended key version: {version.hex()}')
+    testnet = version in (TESTNET_PRIVATE, TESTNET_PUBLIC)
+    depth = raw[4]
+    parent_fingerprint = raw[5:9]
+    child_number = int.from_bytes(raw[9:13], 'big')
+    chain_code = raw[13:45]
+    key = raw[45:]
+    if version in (MAINNET_PRIVATE, TESTNET_PRIVATE):
+      if key[0] != 0:
+        raise ValueError('bad private key prefix')
+      secret = int.from_bytes(key[1:], 'big')
+      if secret == 0 or secret >= N:
+        raise ValueError('private key out of range')
+      return cls(chain_code, secret=secret, depth=depth,
+        parent_fingerprint=parent_fingerprint, child_number=child_number, testnet=testnet)
+    return cls(chain_code, point=S256Point.parse(key), depth=depth,
+      parent_fingerprint=parent_fingerprint, child_number=child_number, testnet=testnet)
@@ -1,3 +1,8 @@
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import hashlib
+import time
+
 from .helper import (
   bits_to_target,
   hash256,
@@ -59,4 +64,94 @@ class Block:
     return 0xffff * 256**(0x1d - 3) / target
 
   def check_pow(self):
-    return little_endian_to_int(hash256(self.serialize())) < self.target()
\ No newline at end of file
+    return little_endian_to_int(hash256(self.serialize())) < self.target()
+
+  def mine(self, start_nonce=0, count=2**32, workers=None, chunk_size=2**20):
+    '''Searches nonces start_nonce to start_nonce + count - 1 for a hash
+    below target(). The first 76 header bytes are hashed once and that
+    SHA-256 state is copied for every nonce. With workers=N the range is
+    handed out to N processes in chunks of chunk_size.
+    Returns (nonce, hashes per second); nonce is None when nothing was
+    found, otherwise it is also stored in self.nonce.'''
+    if start_nonce < 0 or start_nonce + count > 2**32:
+      raise ValueError('nonce range out of bounds: {} {}'.format(start_nonce, count))
+    prefix = self.serialize()[:76]
+    target = self.target()
+    start = time.perf_counter()
+    if not workers or workers < 2:
+      nonce, hashes = mine_range(prefix, target, start_nonce, count)
+    else:
+      nonce, hashes = None, 0
+      chunks = iter(range(start_nonce, start_nonce + count, chunk_size))
+      with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for first in chunks:
+          pending.add(executor.submit(mine_range, prefix, target, first, min(chunk_size, start_nonce + count - first)))
+          if len(pending) < 2 * workers:
+            continue
+          done, pending = wait(pending, return_when=FIRST_COMPLETED)
+          for future in done:
+            found, tried = future.result()
+            hashes += tried
+            if found is not None and nonce is None:
+              nonce = found
+          if nonce is not None:
+            break
+        if nonce is not None:
+          for future in pending:
+            future.cancel()
+        for future in pending:
+          if not future.cancelled():
+            found, tried = future.result()
+            hashes += tried
+            if found is not None and nonce is None:
+              nonce = found
+    elapsed = time.perf_counter() - start
+    if nonce is not None:
+      self.nonce = int_to_little_endian(nonce, 4)
+    return nonce, hashes / elapsed if elapsed else 0.0
+
+def pack_headers(headers):
+  '''Returns headers as one contiguous buffer of 80-byte headers.
+  headers can already be such a buffer or a list of Blocks.'''
+  if isinstance(headers, (bytes, bytearray, memoryview)):
+    buf = memoryview(headers).cast('B')
+    if len(buf) % 80:
+      raise ValueError('buffer is not a whole number of headers: {}'.format(len(buf)))
+    return buf
+  return memoryview(b''.join(block.serialize() for block in headers))
+
+def hash_headers(headers):
+  '''Returns the hash256 digests (internal byte order) of many headers
+  as one buffer of 32-byte digests'''
+  buf = pack_headers(headers)
+  sha256 = hashlib.sha256
+  return b''.join(sha256(sha256(buf[i:i + 80]).digest()).digest() for i in range(0, len(buf), 80))
+
+def check_pow_many(headers):
+  '''Batch version of Block.check_pow for a list of Blocks or a buffer
+  of 80-byte headers. Returns a list of booleans, one per header.
+  Targets are decoded once per distinct bits value.'''
+  buf = pack_headers(headers)
+  digests = hash_headers(buf)
+  targets = {}
+  result = []
+  for i, j in zip(range(72, len(buf), 80), range(0, len(digests), 32)):
+    bits = bytes(buf[i:i + 4])
+    target = targets.get(bits)
+    if target is None:
+      target = targets[bits] = bits_to_target(bits)
+    result.append(int.from_bytes(digests[j:j + 32], 'little') < target)
+  return result
+
+def mine_range(prefix, target, start_nonce, count):
+  '''Tries count nonces after the 76-byte header prefix.
+  Returns (first nonce with a hash below target or None, hashes tried)'''
+  midstate = hashlib.sha256(prefix)
+  sha256 = hashlib.sha256
+  for nonce in range(start_nonce, start_nonce + count):
+    h = midstate.copy()
+    h.update(nonce.to_bytes(4, 'little'))
+    if int.from_bytes(sha256(h.digest()).digest(), 'little') < target:
+      return nonce, nonce - start_nonce + 1
+  return None, count
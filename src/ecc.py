@@ -1,5 +1,7 @@
 # Eliptic Curve Cryptography
 class FieldElement:
+  __slots__ = ('num', 'prime')
+
   def __init__(self, num, prime):
     if num >= prime or num < 0:
       error = 'Num {} not in field range 0 to {}'.format(num, prime-1)
@@ -53,6 +55,7 @@ class FieldElement:
     return self.__class__(num=num, prime=self.prime)
 
 class Point:
+  __slots__ = ('a', 'b', 'x', 'y')
   C1 = 2
   C2 = 3
   def __init__(self, x, y, a, b):
@@ -114,3 +117,18 @@ class Point:
     return result
 
 
+
+def batch_inverse(nums, prime):
+  '''Montgomery's trick: returns the inverses of all nums modulo prime
+  using a single modular inversion. Every num must be non-zero.'''
+  prefix = []
+  product = 1
+  for num in nums:
+    prefix.append(product)
+    product = product * num % prime
+  inverse = pow(product, prime - 2, prime)
+  result = [0] * len(nums)
+  for i in range(len(nums) - 1, -1, -1):
+    result[i] = inverse * prefix[i] % prime
+    inverse = inverse * nums[i] % prime
+  return result
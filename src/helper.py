@@ -1,9 +1,20 @@
+from functools import lru_cache
+
 import hashlib
 
 SIGHASH_ALL = 1
 SIGHASH_NONE = 2
 SIGHASH_SINGLE = 3
 BASE58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+BASE58_INDEX = {c: i for i, c in enumerate(BASE58_ALPHABET)}
+BASE58_PAIRS = [a + b for a in BASE58_ALPHABET for b in BASE58_ALPHABET]
+BASE58_PAIR_INDEX = {pair: i for i, pair in enumerate(BASE58_PAIRS)}
+BECH32_ALPHABET = 'qpzry9x8gf2tvdw0s3jn54khce6mua7l'
+BECH32_INDEX = {c: i for i, c in enumerate(BECH32_ALPHABET)}
+BECH32_PAIR_INDEX = {a + b: i * 32 + j for i, a in enumerate(BECH32_ALPHABET) for j, b in enumerate(BECH32_ALPHABET)}
+BECH32_GENERATOR = (0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3)
+BECH32_CONST = 1
+BECH32M_CONST = 0x2bc830a3
 TWO_WEEKS = 60 * 60 * 24 * 14
 SATOSHIS = 100000000
 
@@ -15,34 +26,162 @@ def hash256(s):
   '''two rounds of sha256'''
   return hashlib.sha256(hashlib.sha256(s).digest()).digest()
 
+def tagged_hash(tag, msg):
+  '''BIP340 tagged hash: sha256(sha256(tag) || sha256(tag) || msg)'''
+  tag_hash = hashlib.sha256(tag.encode()).digest()
+  return hashlib.sha256(tag_hash + tag_hash + msg).digest()
+
 def encode_base58(s):
-  count = 0
-  for c in s:
-    if c == 0:
-      count += 1
-    else:
-      break
+  count = len(s) - len(bytes(s).lstrip(b'\x00'))
   num = int.from_bytes(s, 'big')
-  prefix = '1' * count
-  result = ''
+  # two digits per divmod, looked up in a 58*58 table
+  parts = []
   while num > 0:
-    num, mod = divmod(num, 58)
-    result = BASE58_ALPHABET[mod] + result
-  return prefix + result
+    num, pair = divmod(num, 3364)
+    parts.append(BASE58_PAIRS[pair])
+  parts.reverse()
+  return '1' * count + ''.join(parts).lstrip('1')
 
 def encode_base58_checksum(b):
   return encode_base58(b + hash256(b)[:4])
 
+def encode_base58_checksum_many(payloads):
+  '''Base58Check encodes every payload, returns a list of strings'''
+  return [encode_base58(b + hash256(b)[:4]) for b in payloads]
+
+def base58_to_int(s):
+  '''Returns the number a Base58 string represents.
+  Raises ValueError on characters outside the alphabet.'''
+  # two characters per lookup; an odd leading character is read alone
+  start = len(s) % 2
+  try:
+    num = BASE58_INDEX[s[0]] if start else 0
+    for i in range(start, len(s), 2):
+      num = num * 3364 + BASE58_PAIR_INDEX[s[i:i + 2]]
+  except KeyError as e:
+    raise ValueError('invalid base58 character in: {}'.format(e.args[0]))
+  return num
+
 def decode_base58(s):
+  '''Decodes an address; returns the hash160 without version byte and checksum'''
+  return decode_base58_checksum(s)[1:]
+
+def decode_base58_checksum(s):
+  '''Decodes a Base58Check string of any length.
+  Returns the payload (version bytes included) without the checksum.'''
+  num = base58_to_int(s)
+  zeros = len(s) - len(s.lstrip('1'))
+  combined = b'\x00' * zeros + num.to_bytes((num.bit_length() + 7) // 8, 'big')
+  payload, checksum = combined[:-4], combined[-4:]
+  if hash256(payload)[:4] != checksum:
+    raise ValueError('bad checksum: {} {}'.format(checksum, hash256(payload)[:4]))
+  return payload
+
+def decode_base58_many(strings):
+  '''Decodes many Base58Check strings, returns a list of payloads
+  (version bytes included). Inverse of encode_base58_checksum_many.'''
+  return [decode_base58_checksum(s) for s in strings]
+
+def bech32_reduction(top, steps):
+  '''What the top 5*steps bits of the checksum state xor into the
+  state after shifting them out one 5-bit symbol at a time'''
+  chk = top << (30 - 5 * steps)
+  for _ in range(steps):
+    b = chk >> 25
+    chk = (chk & 0x1ffffff) << 5
+    for i in range(5):
+      if (b >> i) & 1:
+        chk ^= BECH32_GENERATOR[i]
+  return chk
+
+# one table for single symbols, one for two symbols (10 bits) at a time
+BECH32_TABLE = [bech32_reduction(top, 1) for top in range(32)]
+BECH32_PAIR_TABLE = [bech32_reduction(top, 2) for top in range(1024)]
+
+def bech32_polymod(values, chk=1):
+  '''BIP173 checksum polymod over 5-bit values, continuing from chk'''
+  for v in values:
+    chk = ((chk & 0x1ffffff) << 5) ^ v ^ BECH32_TABLE[chk >> 25]
+  return chk
+
+@lru_cache(maxsize=64)
+def bech32_hrp_state(hrp):
+  '''Polymod state after the expanded human readable part'''
+  return bech32_polymod([ord(x) >> 5 for x in hrp] + [0] + [ord(x) & 31 for x in hrp])
+
+def bech32_split(s):
+  '''Checks the form of a bech32 string. Returns (hrp, num, length, residue):
+  the data part as one number of length 5-bit symbols and the polymod
+  residue of the whole string, computed two symbols at a time.'''
+  if len(s) > 90 or (s.lower() != s and s.upper() != s):
+    raise ValueError('bad bech32 string: {}'.format(s))
+  s = s.lower()
+  pos = s.rfind('1')
+  if pos < 1 or pos + 7 > len(s) or any(ord(x) < 33 or ord(x) > 126 for x in s[:pos]):
+    raise ValueError('bad bech32 string: {}'.format(s))
+  hrp, data = s[:pos], s[pos + 1:]
+  chk = bech32_hrp_state(hrp)
   num = 0
-  for c in s:
-    num *= 58
-    num += BASE58_ALPHABET.index(c)
-  combined = num.to_bytes(25, byteorder='big')
-  checksum = combined[-4:]
-  if hash256(combined[:-4])[:4] != checksum:
-    raise ValueError('bad address: {} {}'.format(checksum, hash256(combined[:-4])[:4]))
-  return combined[1:-4]
+  start = len(data) % 2
+  try:
+    if start:
+      num = BECH32_INDEX[data[0]]
+      chk = ((chk & 0x1ffffff) << 5) ^ num ^ BECH32_TABLE[chk >> 25]
+    for i in range(start, len(data), 2):
+      v = BECH32_PAIR_INDEX[data[i:i + 2]]
+      chk = ((chk & 0xfffff) << 10) ^ v ^ BECH32_PAIR_TABLE[chk >> 20]
+      num = num << 10 | v
+  except KeyError:
+    raise ValueError('invalid bech32 character in: {}'.format(s))
+  return hrp, num, len(data), chk
+
+def encode_bech32(hrp, version, program):
+  '''Encodes a witness program as a segwit address.
+  Version 0 uses bech32, versions 1 to 16 bech32m (BIP350).'''
+  check_witness_program(version, program)
+  bits = 8 * len(program)
+  pad = -bits % 5
+  length = 1 + (bits + pad) // 5
+  num = version << (bits + pad) | int.from_bytes(program, 'big') << pad
+  values = [(num >> 5 * i) & 31 for i in range(length - 1, -1, -1)]
+  const = BECH32_CONST if version == 0 else BECH32M_CONST
+  num = num << 30 | bech32_polymod(values + [0] * 6, bech32_hrp_state(hrp)) ^ const
+  data = ''.join(BECH32_ALPHABET[(num >> 5 * i) & 31] for i in range(length + 5, -1, -1))
+  return hrp + '1' + data
+
+def decode_bech32(s):
+  '''Decodes a segwit address. Returns (hrp, version, program),
+  raises ValueError for anything that is not a valid address.'''
+  hrp, num, length, residue = bech32_split(s)
+  bits = 5 * (length - 7)
+  version = num >> (bits + 30)
+  if residue != (BECH32_CONST if version == 0 else BECH32M_CONST):
+    raise ValueError('bad bech32 checksum: {}'.format(s))
+  pad = bits % 8
+  program = (num >> 30) & ((1 << bits) - 1)
+  if pad > 4 or program & ((1 << pad) - 1):
+    raise ValueError('bad bech32 padding: {}'.format(s))
+  program = (program >> pad).to_bytes(bits // 8, 'big')
+  check_witness_program(version, program)
+  return hrp, version, program
+
+def decode_bech32_many(strings):
+  '''Decodes many segwit addresses. Returns a list with
+  (hrp, version, program) for valid addresses and None for the rest.'''
+  result = []
+  for s in strings:
+    try:
+      result.append(decode_bech32(s))
+    except ValueError:
+      result.append(None)
+  return result
+
+def check_witness_program(version, program):
+  '''Raises ValueError unless BIP141 allows this witness program'''
+  if not 0 <= version <= 16 or not 2 <= len(program) <= 40:
+    raise ValueError('bad witness program: {} {}'.format(version, program.hex()))
+  if version == 0 and len(program) not in (20, 32):
+    raise ValueError('bad witness v0 program length: {}'.format(len(program)))
 
 def little_endian_to_int(b):
   '''little_endian_to_int takes byte sequence as a little-endian number.
@@ -70,6 +209,19 @@ def read_varint(s):
     # anything else is just the integer
     return i
 
+def read_varint_at(buf, offset):
+  '''Reads a variable integer from a bytes-like buf at offset.
+  Returns (integer, offset just past it)'''
+  i = buf[offset]
+  if i == 0xfd:
+    return little_endian_to_int(buf[offset + 1:offset + 3]), offset + 3
+  elif i == 0xfe:
+    return little_endian_to_int(buf[offset + 1:offset + 5]), offset + 5
+  elif i == 0xff:
+    return little_endian_to_int(buf[offset + 1:offset + 9]), offset + 9
+  else:
+    return i, offset + 1
+
 def encode_varint(i):
   '''encodes an integer as a varint'''
   if i < 0xfd:
@@ -91,6 +243,14 @@ def h160_to_p2sh_address(h160, testnet=False):
   prefix = b'\xc4' if testnet else b'\x05'
   return encode_base58_checksum(prefix + h160)
 
+def h160_to_p2wpkh_address(h160, testnet=False):
+  hrp = 'tb' if testnet else 'bc'
+  return encode_bech32(hrp, 0, h160)
+
+def sha256_to_p2wsh_address(s256, testnet=False):
+  hrp = 'tb' if testnet else 'bc'
+  return encode_bech32(hrp, 0, s256)
+
 def bits_to_target(bits):
   exponent = bits[-1]
   coefficient = little_endian_to_int((bits[:-1]))
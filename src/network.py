@@ -188,19 +188,24 @@ class GetHeadersMessage:
 class HeadersMessage:
   command = b'headers'
 
-  def __init__(self, blocks):
+  def __init__(self, blocks, raw=None):
       self.blocks = blocks
+      # the 80-byte headers back to back, for check_pow_many
+      self.raw = raw
 
   @classmethod
   def parse(cls, stream):
     num_headers = read_varint(stream)
     blocks = []
+    raw = []
     for _ in range(num_headers):
-      blocks.append(Block.parse(stream))  # <1>
+      header = stream.read(80)
+      raw.append(header)
+      blocks.append(Block.parse(BytesIO(header)))  # <1>
       num_txs = read_varint(stream)  # <2>
       if num_txs != 0:  # <3>
         raise RuntimeError('number of txs not 0')
-    return cls(blocks)
+    return cls(blocks, b''.join(raw))
 
 class SimpleNode:
   def __init__(self, host, port=None, testnet=False, logging=False):
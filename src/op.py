@@ -1,4 +1,8 @@
 import hashlib
+import os
+import threading
+
+from collections import OrderedDict
 
 from .helper import (
   hash160,
@@ -10,6 +14,80 @@ from .secp256k1 import (
   Signature
 )
 
+class SignatureCache:
+  '''Process-wide cache of signatures that already verified.
+  Entries are keyed by a salted sha256 of (z, DER signature, SEC pubkey),
+  so only 32 bytes are stored per signature and the keys cannot be
+  predicted from outside. At most capacity entries are kept (LRU).'''
+  def __init__(self, capacity=100000):
+    self.capacity = capacity
+    self.salt = os.urandom(32)
+    self.hits = 0
+    self.misses = 0
+    self.entries = OrderedDict()
+    self.lock = threading.Lock()
+
+  def __len__(self):
+    return len(self.entries)
+
+  def key(self, z, der, sec):
+    return hashlib.sha256(self.salt + z.to_bytes(32, 'big') + der + sec).digest()
+
+  def contains(self, key):
+    with self.lock:
+      if key in self.entries:
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return True
+      self.misses += 1
+      return False
+
+  def add(self, key):
+    with self.lock:
+      if self.capacity <= 0:
+        return
+      self.entries[key] = None
+      while len(self.entries) > self.capacity:
+        self.entries.popitem(last=False)
+
+  def verify(self, point, z, sig, der, sec):
+    '''point.verify(z, sig), answered from the cache when possible'''
+    key = self.key(z, der, sec)
+    if self.contains(key):
+      return True
+    if point.verify(z, sig):
+      self.add(key)
+      return True
+    return False
+
+  def resize(self, capacity):
+    with self.lock:
+      self.capacity = capacity
+      while len(self.entries) > max(capacity, 0):
+        self.entries.popitem(last=False)
+
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+      self.hits = 0
+      self.misses = 0
+
+  def stats(self):
+    with self.lock:
+      return {
+        'size': len(self.entries),
+        'capacity': self.capacity,
+        'memory': 32 * len(self.entries),
+        'hits': self.hits,
+        'misses': self.misses,
+      }
+
+SIG_CACHE = SignatureCache()
+
+# match OP_CHECKMULTISIG signatures to pubkeys by public key recovery
+# instead of trying point.verify against each key in turn
+MULTISIG_RECOVERY = True
+
 def encode_num(num):
   if num == 0:
     return b''
@@ -580,7 +658,10 @@ def op_hash256(stack):
   stack.append(hash256(element))
   return True
 
-def op_checksig(stack, z):
+def op_checksig(stack, z, deferred=None):
+  '''When deferred is a list the signature is not checked here:
+  (point, z, sig) is appended to it and the check is assumed to pass.
+  The caller must verify the deferred signatures afterwards.'''
   if len(stack) < 2:
     return False
   sec_pubkey = stack.pop()
@@ -590,14 +671,18 @@ def op_checksig(stack, z):
     sig = Signature.parse(der_signature)
   except (ValueError, SyntaxError) as e:
     return False
-  if point.verify(z, sig):
+  if deferred is not None:
+    if not SIG_CACHE.contains(SIG_CACHE.key(z, der_signature, sec_pubkey)):
+      deferred.append((point, z, sig))
+    stack.append(encode_num(1))
+  elif SIG_CACHE.verify(point, z, sig, der_signature, sec_pubkey):
     stack.append(encode_num(1))
   else:
     stack.append(encode_num(0))
   return True
 
-def op_checksigverify(stack, z):
-  return op_checksig(stack, z) and op_verify(stack)
+def op_checksigverify(stack, z, deferred=None):
+  return op_checksig(stack, z, deferred) and op_verify(stack)
 
 def pop_n_elements(stack, n):
   output = []
@@ -607,7 +692,8 @@ def pop_n_elements(stack, n):
     output.append(stack.pop())
   return stack, output
 
-def op_checkmultisig(stack, z):
+def op_checkmultisig(stack, z, deferred=None):
+  # matching signatures to keys needs real results, so these are never deferred
   if len(stack) < 1:
     return False
   
@@ -619,22 +705,35 @@ def op_checkmultisig(stack, z):
 
   stack.pop()
   try:
-    points = [S256Point.parse(sec) for sec in sec_pubkeys]
-    sigs = [Signature.parse(der[:-1]) for der in der_signatures]
-    for sig in sigs:
+    points = [(sec, S256Point.parse(sec)) for sec in sec_pubkeys]
+    sigs = [(der[:-1], Signature.parse(der[:-1])) for der in der_signatures]
+    for der, sig in sigs:
       if len(points) == 0:
         return False
+      candidates = None
       while points:
-        point = points.pop(0)
-        if point.verify(z, sig):
+        sec, point = points.pop(0)
+        key = SIG_CACHE.key(z, der, sec)
+        if SIG_CACHE.contains(key):
+          break
+        if not MULTISIG_RECOVERY:
+          if SIG_CACHE.verify(point, z, sig, der, sec):
+            break
+          continue
+        # recover the keys this signature can belong to once,
+        # then match them instead of verifying against every pubkey
+        if candidates is None:
+          candidates = S256Point.recover_candidates(z, sig)
+        if point in candidates:
+          SIG_CACHE.add(key)
           break
     stack.append(encode_num(1))
   except (ValueError, SyntaxError):
     return False
   return True
 
-def op_checkmultisigverify(stack, z):
-  return op_checkmultisig(stack, z) and op_verify(stack)
+def op_checkmultisigverify(stack, z, deferred=None):
+  return op_checkmultisig(stack, z, deferred) and op_verify(stack)
 
 def op_checklocktimeverify(stack, locktime, sequence):
   if sequence == 0xffffffff:
@@ -6,6 +6,7 @@ from .helper import (
   int_to_little_endian,
   little_endian_to_int,
   read_varint,
+  read_varint_at,
 )
 from .op import (
   OP_CODE_FUNCTIONS,
@@ -26,13 +27,64 @@ def p2sh_script(h160):
   '''Takes a hash160 and returns the p2sh ScriptPubKey'''
   return Script([0xa9, h160, 0x87])
 
+def p2wpkh_script(h160):
+  '''Takes a hash160 and returns the p2wpkh ScriptPubKey'''
+  return Script([0x00, h160])
+
+def p2wsh_script(s256):
+  '''Takes a sha256 of a witness script and returns the p2wsh ScriptPubKey'''
+  return Script([0x00, s256])
+
+def parse_cmds(raw, length=None):
+  '''Parses the body of a script (without its length prefix) into cmds.
+  length is the declared length when raw may have been cut short.'''
+  if length is None:
+    length = len(raw)
+  cmds = []
+  count = 0
+  while count < length:
+    if count >= len(raw):
+      raise SyntaxError('Parsing Script Failed.')
+    current_byte = raw[count]
+    count += 1
+    if current_byte >= 1 and current_byte <= 75:
+      n = current_byte
+      cmds.append(bytes(raw[count:count + n]))
+      count += n
+    elif current_byte == 76: # op_pushdata1
+      data_length = little_endian_to_int(raw[count:count + 1])
+      cmds.append(bytes(raw[count + 1:count + 1 + data_length]))
+      count += data_length + 1
+    elif current_byte == 77: # op_pushdata2
+      data_length = little_endian_to_int(raw[count:count + 2])
+      cmds.append(bytes(raw[count + 2:count + 2 + data_length]))
+      count += data_length + 2
+    else:
+      op_code = current_byte
+      cmds.append(op_code)
+  if count != length:
+    raise SyntaxError('Parsing Script Failed.')
+  return cmds
+
 class Script:
   def __init__(self, cmds=None):
+    self.raw = None
     if cmds is None:
       self.cmds = []
     else:
       self.cmds = cmds
 
+  def __getattr__(self, name):
+    # cmds of a script from parse_view are only parsed on first access
+    if name == 'cmds' and self.__dict__.get('raw') is not None:
+      self.cmds = parse_cmds(self.raw)
+      return self.cmds
+    raise AttributeError(name)
+
+  def __getstate__(self):
+    # memoryviews cannot be pickled, send the parsed cmds instead
+    return {'raw': None, 'cmds': self.cmds}
+
   def __repr__(self):
     result = []
     for cmd in self.cmds:
@@ -52,32 +104,26 @@ class Script:
   @classmethod
   def parse(cls, s):
     length = read_varint(s)
-    cmds = []
-    count = 0
-    while count < length:
-      current = s.read(1)
-      count += 1
-      current_byte = int(current[0])
-      if current_byte >= 1 and current_byte <= 75:
-        n = current_byte
-        cmds.append(s.read(n))
-        count += n
-      elif current_byte == 76: # op_pushdata1
-        data_length = little_endian_to_int(s.read(1))
-        cmds.append(s.read(data_length))
-        count += data_length + 1
-      elif current_byte == 77: # op_pushdata2
-        data_length = little_endian_to_int(s.read(2))
-        cmds.append(s.read(data_length))
-        count += data_length + 2
-      else:
-        op_code = current_byte
-        cmds.append(op_code)
-    if count != length:
+    return cls(parse_cmds(s.read(length), length))
+
+  @classmethod
+  def parse_view(cls, buf, offset=0):
+    '''Reads a length-prefixed script from a memoryview at offset
+    without copying it. Returns (Script, offset just past it).'''
+    length = buf[offset]
+    if length < 0xfd:
+      offset += 1
+    else:
+      length, offset = read_varint_at(buf, offset)
+    if offset + length > len(buf):
       raise SyntaxError('Parsing Script Failed.')
-    return cls(cmds)
+    script = cls.__new__(cls)
+    script.raw = buf[offset:offset + length]
+    return script, offset + length
 
   def raw_serialize(self):
+    if 'cmds' not in self.__dict__:
+      return bytes(self.raw)
     result = b''
     for cmd in self.cmds:
       if type(cmd) == int:
@@ -102,7 +148,7 @@ class Script:
     total = len(result)
     return encode_varint(total) + result
 
-  def evaluate(self, z):
+  def evaluate(self, z, deferred=None):
     cmds = self.cmds[:]
     stack = []
     altstack = []
@@ -119,7 +165,7 @@ class Script:
             LOGGER.info(f'Bad OP: {OP_CODE_NAMES[cmd]}')
             return False
         elif cmd in (172, 173, 174, 175): # Signing operations, require sig_hash
-          if not operation(stack, z):
+          if not operation(stack, z, deferred):
             LOGGER.info(f'Bad OP: {OP_CODE_NAMES[cmd]}')
             return False
         else:
@@ -163,3 +209,13 @@ class Script:
     return len(self.cmds) == 3 and self.cmds[0] == 0xa9 \
         and type(self.cmds[1]) == bytes and len(self.cmds[1]) == 20 \
         and self.cmds[2] == 0x87
+
+  def is_p2wpkh_script_pubkey(self):
+    '''Returns whether this follows the OP_0 <20 byte hash> pattern.'''
+    return len(self.cmds) == 2 and self.cmds[0] == 0x00 \
+        and type(self.cmds[1]) == bytes and len(self.cmds[1]) == 20
+
+  def is_p2wsh_script_pubkey(self):
+    '''Returns whether this follows the OP_0 <32 byte hash> pattern.'''
+    return len(self.cmds) == 2 and self.cmds[0] == 0x00 \
+        and type(self.cmds[1]) == bytes and len(self.cmds[1]) == 32
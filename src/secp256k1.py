@@ -1,33 +1,357 @@
-from .ecc import FieldElement, Point
-from random import randint
-from .helper import hash160, encode_base58_checksum
+from .ecc import FieldElement, Point, batch_inverse
+from .helper import (
+  encode_base58_checksum,
+  encode_base58_checksum_many,
+  hash160,
+  tagged_hash,
+)
 
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
 import hashlib
 import hmac
+import json
+import os
+import secrets
+import sys
+import threading
 
 A = 0
 B = 7
 P = 2**256 - 2**32 - 977
 N = 0xfffffffffffffffffffffffffffffffebaaedce6af48a03bbfd25e8cd0364141
 
+WNAF_WIDTH = 5
+
+# GLV endomorphism: lambda * (x, y) == (beta * x, y) for every point
+LAMBDA = 0x5363ad4cc05c30e0a5261c028812645a122e22ea20816678df02967c1b23bd72
+BETA = 0x7ae96a2b657c07106e64479eac3434e99cf0497512f58995c1396c28719501ee
+# short basis of the lattice {(a, b): a + b * lambda == 0 mod N}
+GLV_A1 = 0x3086d221a7d46bcde86c90e49284eb15
+GLV_B1 = -0xe4437ed6010e88286f547fa90abfe4c3
+GLV_A2 = 0x114ca50f7a8e2f3f657c1108d9d44cfd8
+GLV_B2 = 0x3086d221a7d46bcde86c90e49284eb15
+
+# Jacobian coordinates: (X, Y, Z) represents the affine point (X/Z^2, Y/Z^3).
+# Z == 0 is the point at infinity. Everything below works on plain ints mod P
+# and only converts back to an affine S256Point once, at the very end.
+INFINITY = (0, 1, 0)
+# multi_multiply normalizes the tables of this many fresh points at once
+NORMALIZE_THRESHOLD = 4
+
+def to_jacobian(point):
+  '''Takes an affine S256Point and returns its Jacobian coordinates'''
+  if point.x is None:
+    return INFINITY
+  return (point.x.num, point.y.num, 1)
+
+def jacobian_to_affine(jacobian):
+  '''Returns the affine (x, y) ints for Jacobian coordinates.
+  This is the only place a modular inversion is needed.'''
+  x, y, z = jacobian
+  z_inv = pow(z, P - 2, P)
+  z_inv2 = z_inv * z_inv % P
+  return x * z_inv2 % P, y * z_inv2 * z_inv % P
+
+def jacobian_to_affine_batch(points):
+  '''Returns affine (x, y) ints for many Jacobian points using a single
+  inversion. The point at infinity maps to None.'''
+  finite = [i for i, point in enumerate(points) if point[2] != 0]
+  z_invs = batch_inverse([points[i][2] for i in finite], P)
+  result = [None] * len(points)
+  for i, z_inv in zip(finite, z_invs):
+    x, y, _ = points[i]
+    z_inv2 = z_inv * z_inv % P
+    result[i] = (x * z_inv2 % P, y * z_inv2 * z_inv % P)
+  return result
+
+def from_jacobian(jacobian):
+  '''Converts Jacobian coordinates back to an affine S256Point'''
+  if jacobian[2] == 0:
+    return S256Point(None, None)
+  return S256Point.trusted(*jacobian_to_affine(jacobian))
+
+def jacobian_double(point):
+  '''Doubles a point in Jacobian coordinates (a = 0)'''
+  x1, y1, z1 = point
+  if z1 == 0 or y1 == 0:
+    return INFINITY
+  a = x1 * x1 % P
+  b = y1 * y1 % P
+  c = b * b % P
+  d = 2 * ((x1 + b) * (x1 + b) - a - c) % P
+  e = 3 * a % P
+  x3 = (e * e - 2 * d) % P
+  y3 = (e * (d - x3) - 8 * c) % P
+  z3 = 2 * y1 * z1 % P
+  return (x3, y3, z3)
+
+def jacobian_add(point1, point2):
+  '''Adds two points in Jacobian coordinates.
+  Uses the cheaper mixed addition when the second point has Z == 1'''
+  x1, y1, z1 = point1
+  x2, y2, z2 = point2
+  if z1 == 0:
+    return point2
+  if z2 == 0:
+    return point1
+  z1z1 = z1 * z1 % P
+  u2 = x2 * z1z1 % P
+  s2 = y2 * z1 * z1z1 % P
+  if z2 == 1:
+    u1 = x1
+    s1 = y1
+  else:
+    z2z2 = z2 * z2 % P
+    u1 = x1 * z2z2 % P
+    s1 = y1 * z2 * z2z2 % P
+  if u1 == u2:
+    if s1 != s2:
+      return INFINITY
+    return jacobian_double(point1)
+  h = (u2 - u1) % P
+  r = (s2 - s1) % P
+  h2 = h * h % P
+  h3 = h * h2 % P
+  u1h2 = u1 * h2 % P
+  x3 = (r * r - h3 - 2 * u1h2) % P
+  y3 = (r * (u1h2 - x3) - s1 * h3) % P
+  z3 = h * z1 * z2 % P
+  return (x3, y3, z3)
+
+def is_affine_sum(point1, point2, point3):
+  '''Checks point1 + point2 == point3 for affine (x, y) ints without an
+  inversion, by clearing the slope denominator from the chord/tangent
+  formulas. None of the points may be the point at infinity.'''
+  x1, y1 = point1
+  x2, y2 = point2
+  x3, y3 = point3
+  if x1 == x2:
+    if y1 != y2 or y1 == 0:
+      return False
+    num, den = 3 * x1 * x1 % P, 2 * y1 % P
+  else:
+    num, den = (y2 - y1) % P, (x2 - x1) % P
+  den2 = den * den % P
+  return (
+    (x3 + x1 + x2) * den2 % P == num * num % P
+    and (y3 + y1) * den % P == num * (x1 - x3) % P
+  )
+
+def jacobian_negate(point):
+  x, y, z = point
+  return (x, -y % P, z)
+
+def wnaf(coefficient, width):
+  '''Returns the width-w non-adjacent form of coefficient,
+  least significant digit first. Non-zero digits are odd and
+  at least width positions apart.'''
+  digits = []
+  while coefficient:
+    if coefficient & 1:
+      digit = coefficient & (2**width - 1)
+      if digit >= 2**(width - 1):
+        digit -= 2**width
+      coefficient -= digit
+    else:
+      digit = 0
+    digits.append(digit)
+    coefficient >>= 1
+  return digits
+
+def odd_multiples(point, width):
+  '''Returns [P, 3P, 5P, ..., (2**(width-1) - 1)P] in Jacobian coordinates'''
+  twice = jacobian_double(point)
+  result = [point]
+  for _ in range(2**(width - 2) - 1):
+    result.append(jacobian_add(result[-1], twice))
+  return result
+
+def glv_split(coefficient):
+  '''Returns (k1, k2) with k1 + k2 * LAMBDA == coefficient mod N
+  and both |k1|, |k2| around 128 bits'''
+  c1 = (2 * GLV_B2 * coefficient + N) // (2 * N)
+  c2 = (-2 * GLV_B1 * coefficient + N) // (2 * N)
+  k1 = coefficient - c1 * GLV_A1 - c2 * GLV_A2
+  k2 = -c1 * GLV_B1 - c2 * GLV_B2
+  return k1, k2
+
+def jacobian_multiply(point, coefficient):
+  '''Left-to-right double-and-add in Jacobian coordinates'''
+  result = INFINITY
+  for bit in bin(coefficient)[2:]:
+    result = jacobian_double(result)
+    if bit == '1':
+      result = jacobian_add(result, point)
+  return result
+
 class S256Field(FieldElement):
+  '''Element of the secp256k1 base field. Results of arithmetic are
+  always reduced mod P, so they skip the range check in __init__.'''
+  __slots__ = ()
+
   def __init__(self, num, prime=None):
     super().__init__(num=num, prime=P)
 
   def __repr__(self):
     return '{:x}'.format(self.num).zfill(64)
 
+  @classmethod
+  def trusted(cls, num):
+    '''Builds an element from an int already in range 0 to P-1'''
+    element = object.__new__(cls)
+    element.num = num
+    element.prime = P
+    return element
+
+  def __add__(self, other):
+    if other.prime != P:
+      raise TypeError('Cannot add two numbers in different fields!')
+    return S256Field.trusted((self.num + other.num) % P)
+
+  def __sub__(self, other):
+    if other.prime != P:
+      raise TypeError('Cannot subtract two numbers in different fields!')
+    return S256Field.trusted((self.num - other.num) % P)
+
+  def __mul__(self, other):
+    if other.prime != P:
+      raise TypeError('Cannot multiply two numbers in different fields!')
+    return S256Field.trusted(self.num * other.num % P)
+
+  def __pow__(self, exponent):
+    return S256Field.trusted(pow(self.num, exponent % (P - 1), P))
+
+  def __truediv__(self, other):
+    if other.prime != P:
+      raise TypeError('Cannot divide two numbers in different fields!')
+    return S256Field.trusted(self.num * pow(other.num, P - 2, P) % P)
+
+  def __rmul__(self, coefficient):
+    return S256Field.trusted(self.num * coefficient % P)
+
   def sqrt(self):
     return self**((P + 1) // 4)
 
+FIELD_A = S256Field(A)
+FIELD_B = S256Field(B)
+
+def wnaf_table(multiples, width, glv):
+  '''Returns (width, P, -P, lambda*P, -lambda*P) lists of odd multiples
+  for strauss_multiply; the lambda lists are None unless glv'''
+  negative = [jacobian_negate(p) for p in multiples]
+  if not glv:
+    return (width, multiples, negative, None, None)
+  endomorphism = [(BETA * x % P, y, z) for x, y, z in multiples]
+  endomorphism_negative = [(BETA * x % P, y, z) for x, y, z in negative]
+  return (width, multiples, negative, endomorphism, endomorphism_negative)
+
+def strauss_multiply(terms, glv=False):
+  '''Interleaved wNAF (Strauss-Shamir) multi-scalar multiplication.
+  terms is a list of (coefficient, wnaf_table); all scalars share a single
+  chain of doublings. With glv every scalar is split in two ~128-bit
+  halves, which halves the length of that chain.'''
+  nafs = []
+  tables = []
+  for coefficient, (width, positive, negative, endomorphism, endomorphism_negative) in terms:
+    if glv:
+      k1, k2 = glv_split(coefficient)
+      split = ((k1, positive, negative), (k2, endomorphism, endomorphism_negative))
+    else:
+      split = ((coefficient, positive, negative),)
+    for k, plus, minus in split:
+      if k == 0:
+        continue
+      if k < 0:
+        k, plus, minus = -k, minus, plus
+      nafs.append(wnaf(k, width))
+      tables.append((plus, minus))
+  if not nafs:
+    return INFINITY
+  result = INFINITY
+  for i in range(max(len(naf) for naf in nafs) - 1, -1, -1):
+    result = jacobian_double(result)
+    for naf, (positive, negative) in zip(nafs, tables):
+      if i < len(naf) and naf[i]:
+        digit = naf[i]
+        if digit > 0:
+          result = jacobian_add(result, positive[digit >> 1])
+        else:
+          result = jacobian_add(result, negative[-digit >> 1])
+  return result
+
+def multi_multiply(pairs, hot=False):
+  '''Returns sum(coefficient * point) for (coefficient, S256Point) pairs
+  in Jacobian coordinates. Multiples of G go through the GeneratorTable,
+  everything else through one shared Strauss-Shamir pass.
+  With hot=True frequently used points get a cached table from POINT_TABLES.'''
+  glv = S256Point.use_glv
+  generator = 0
+  terms = []
+  fresh = []
+  for coefficient, point in pairs:
+    coefficient %= N
+    if point == G:
+      generator += coefficient
+    elif coefficient and point.x is not None:
+      table = POINT_TABLES.get(point) if hot else None
+      if table is None:
+        fresh.append((len(terms), odd_multiples(to_jacobian(point), WNAF_WIDTH)))
+      terms.append((coefficient, table))
+  if len(fresh) >= NORMALIZE_THRESHOLD:
+    # one shared inversion turns every table entry into Z == 1,
+    # so all additions in the Strauss pass take the mixed path
+    affine = jacobian_to_affine_batch([p for _, multiples in fresh for p in multiples])
+    size = 2**(WNAF_WIDTH - 2)
+    fresh = [(i, [xy + (1,) if xy else INFINITY for xy in affine[j * size:(j + 1) * size]])
+             for j, (i, _) in enumerate(fresh)]
+  for i, multiples in fresh:
+    terms[i] = (terms[i][0], wnaf_table(multiples, WNAF_WIDTH, glv))
+  result = strauss_multiply(terms, glv=glv)
+  if generator % N:
+    result = jacobian_add(result, GeneratorTable.multiply(generator % N))
+  return result
+
+def recover_pair(z, sig, x):
+  '''Recovers the Jacobian keys r^-1 * (s*R - z*G) for the two points R
+  with R.x == x, even y first. Returns None when x is not on the curve.
+  Both share the same s*r^-1 * R and z*r^-1 * G multiplications.'''
+  try:
+    point = S256Point.lift_x(x)
+  except ValueError:
+    return None
+  r_inv = pow(sig.r, N - 2, N)
+  a = sig.s * r_inv % N
+  b = -z * r_inv % N
+  glv = S256Point.use_glv
+  table = wnaf_table(odd_multiples(to_jacobian(point), WNAF_WIDTH), WNAF_WIDTH, glv)
+  ar = strauss_multiply([(a, table)], glv=glv)
+  bg = GeneratorTable.multiply(b)
+  return jacobian_add(bg, ar), jacobian_add(bg, jacobian_negate(ar))
+
 class S256Point(Point):
+  # split scalars with the GLV endomorphism; turn off to benchmark the plain path
+  use_glv = True
+
+  __slots__ = ()
+
   def __init__(self, x, y, a=None, b=None):
-    a, b = S256Field(A), S256Field(B)
     if type(x) == int:
-      super().__init__(x=S256Field(x), y=S256Field(y), a=a, b=b)
+      super().__init__(x=S256Field(x), y=S256Field(y), a=FIELD_A, b=FIELD_B)
     else:
-      super().__init__(x=x, y=y, a=a, b=b)
+      super().__init__(x=x, y=y, a=FIELD_A, b=FIELD_B)
+
+  @classmethod
+  def trusted(cls, x, y):
+    '''Builds a point from affine ints produced by our own arithmetic,
+    skipping the curve check. Parsing and the public constructor still validate.'''
+    point = object.__new__(cls)
+    point.a = FIELD_A
+    point.b = FIELD_B
+    point.x = S256Field.trusted(x)
+    point.y = S256Field.trusted(y)
+    return point
 
   def __repr__(self):
     if self.x is None:
@@ -36,8 +360,22 @@ class S256Point(Point):
       return 'S256Point({}, {})'.format(self.x, self.y)
 
   def __rmul__(self, coefficient):
-    coef = coefficient % N
-    return super().__rmul__(coef)
+    return from_jacobian(multi_multiply([(coefficient, self)]))
+
+  @classmethod
+  def normalize_batch(cls, points):
+    '''Converts many Jacobian (X, Y, Z) points to affine S256Points
+    with a single modular inversion'''
+    return [
+      cls(None, None) if affine is None else cls.trusted(*affine)
+      for affine in jacobian_to_affine_batch(points)
+    ]
+
+  @classmethod
+  def multi_mul(cls, pairs):
+    '''Returns the sum of scalar * point over (scalar, point) pairs,
+    sharing the doublings between all the scalars'''
+    return from_jacobian(multi_multiply(pairs))
 
   def hash160(self, compressed=True):
     return hash160(self.sec(compressed))
@@ -46,8 +384,78 @@ class S256Point(Point):
     s_inv = pow(sig.s, N-2, N)
     u = z * s_inv % N
     v = sig.r * s_inv % N
-    total = u * G + v * self
-    return total.x.num == sig.r
+    total = from_jacobian(multi_multiply([(u, G), (v, self)], hot=True))
+    return total.x is not None and total.x.num == sig.r
+
+  def verify_compact(self, z, compact):
+    '''Checks a 65-byte compact signature by recovering its key'''
+    try:
+      sig, recid, _ = Signature.parse_compact(compact)
+      return self.recover(z, sig, recid) == self
+    except (ValueError, SyntaxError):
+      return False
+
+  @classmethod
+  def recover(cls, z, sig, recid):
+    '''Returns the public key that signed z, given the recovery id
+    (bit 0: parity of R.y, bit 1: R.x == r + N)'''
+    if not (0 < sig.r < N and 0 < sig.s < N) or not 0 <= recid < 4:
+      raise ValueError('Cannot recover a key from {} with recid {}'.format(sig, recid))
+    pair = recover_pair(z, sig, sig.r + (recid >> 1) * N)
+    if pair is None or pair[recid & 1][2] == 0:
+      raise ValueError('No key recovers {} with recid {}'.format(sig, recid))
+    return from_jacobian(pair[recid & 1])
+
+  @classmethod
+  def recover_candidates(cls, z, sig):
+    '''Returns every public key for which sig over z verifies,
+    i.e. the keys for recovery ids 0 and 1. The keys for R.x == r + N
+    are left out because verify compares R.x with r unreduced.'''
+    if not (0 < sig.r < N and 0 < sig.s < N):
+      return []
+    pair = recover_pair(z, sig, sig.r)
+    if pair is None:
+      return []
+    return cls.normalize_batch([point for point in pair if point[2] != 0])
+
+  def verify_schnorr(self, msg, sig):
+    '''BIP340 verification of a SchnorrSignature over msg bytes.
+    Only the x coordinate of this key is used, as with x-only keys.'''
+    if sig.r >= P or sig.s >= N:
+      return False
+    point = self.even_y()
+    e = schnorr_challenge(sig.r, point, msg)
+    total = multi_multiply([(sig.s, G), (N - e, point)], hot=True)
+    if total[2] == 0:
+      return False
+    x, y = jacobian_to_affine(total)
+    return y % 2 == 0 and x == sig.r
+
+  def even_y(self):
+    '''Returns whichever of this point and its negation has an even y'''
+    if self.y.num % 2 == 0:
+      return self
+    return self.trusted(self.x.num, P - self.y.num)
+
+  def xonly(self):
+    '''Returns the 32-byte BIP340 x-only public key'''
+    return self.x.num.to_bytes(32, 'big')
+
+  @classmethod
+  def lift_x(cls, x):
+    '''Returns the point with the given x and an even y'''
+    if x >= P:
+      raise ValueError('x not in field range: {:x}'.format(x))
+    alpha = (x * x * x + B) % P
+    beta = pow(alpha, (P + 1) // 4, P)
+    if beta * beta % P != alpha:
+      raise ValueError('{:x} is not the x of a point on the curve.'.format(x))
+    return cls.trusted(x, beta if beta % 2 == 0 else P - beta)
+
+  @classmethod
+  def parse_xonly(cls, xonly):
+    '''returns a Point object from a 32-byte x-only key'''
+    return cls.lift_x(int.from_bytes(xonly, 'big'))
 
   def sec(self, compressed=True):
     '''Retuns thse binary version of the SEC format'''
@@ -67,7 +475,19 @@ class S256Point(Point):
 
   @classmethod
   def parse(self, sec_bin):
-    '''returns a Point object from a SEC binary (not hex)'''
+    '''returns a Point object from a SEC binary (not hex)
+    Recently parsed keys are served from SEC_CACHE.'''
+    sec_bin = bytes(sec_bin)
+    point = SEC_CACHE.get(sec_bin)
+    if point is None:
+      point = self.parse_uncached(sec_bin)
+      if point is not None:
+        SEC_CACHE.put(sec_bin, point)
+    return point
+
+  @classmethod
+  def parse_uncached(self, sec_bin):
+    '''returns a Point object from a SEC binary, always decoding it'''
     if sec_bin[0] == 4:
       x = int.from_bytes(sec_bin[1:33], 'big')
       y = int.from_bytes(sec_bin[33:65], 'big')
@@ -85,11 +505,290 @@ class S256Point(Point):
       elif sec_bin[0] == 3: # ODD
         return S256Point(x, odd_beta)
 
+class PointTableCache:
+  '''Wide-window precomputed tables for public keys that are verified often.
+  A point gets a table of affine odd multiples once it has been seen
+  threshold times; at most capacity tables are kept, least recently used
+  first out. Use counts for not-yet-hot points are bounded the same way.'''
+  def __init__(self, threshold=8, capacity=256, width=8):
+    self.threshold = threshold
+    self.capacity = capacity
+    self.width = width
+    self.hits = 0
+    self.builds = 0
+    self.memory = 0
+    self.uses = OrderedDict()
+    self.tables = OrderedDict()
+    self.lock = threading.Lock()
+
+  def __len__(self):
+    return len(self.tables)
+
+  def get(self, point):
+    '''Returns a wnaf_table for point if it is hot, otherwise None'''
+    key = (point.x.num, point.y.num)
+    with self.lock:
+      cached = self.tables.get(key)
+      if cached is not None:
+        self.hits += 1
+        self.tables.move_to_end(key)
+        return cached[0]
+      if self.capacity <= 0:
+        return None
+      count = self.uses.pop(key, 0) + 1
+      self.uses[key] = count
+      while len(self.uses) > 8 * self.capacity:
+        self.uses.popitem(last=False)
+      if count < self.threshold:
+        return None
+      del self.uses[key]
+      width = self.width
+    multiples = [
+      (x, y, 1) for x, y in
+      jacobian_to_affine_batch(odd_multiples(to_jacobian(point), width))
+    ]
+    table = wnaf_table(multiples, width, glv=True)
+    size = sum(
+      sys.getsizeof(m) + sys.getsizeof(m[0]) + sys.getsizeof(m[1])
+      for column in table[1:] for m in column
+    )
+    with self.lock:
+      self.builds += 1
+      if key not in self.tables:
+        self.tables[key] = (table, size)
+        self.memory += size
+        self.evict()
+    return table
+
+  def evict(self):
+    while len(self.tables) > max(self.capacity, 0):
+      _, (_, size) = self.tables.popitem(last=False)
+      self.memory -= size
+
+  def resize(self, capacity):
+    with self.lock:
+      self.capacity = capacity
+      self.evict()
+
+  def clear(self):
+    with self.lock:
+      self.uses.clear()
+      self.tables.clear()
+      self.hits = 0
+      self.builds = 0
+      self.memory = 0
+
+  def stats(self):
+    with self.lock:
+      return {
+        'tables': len(self.tables),
+        'memory': self.memory,
+        'capacity': self.capacity,
+        'threshold': self.threshold,
+        'width': self.width,
+        'hits': self.hits,
+        'builds': self.builds,
+      }
+
+POINT_TABLES = PointTableCache()
+
+class SecCache:
+  '''Bounded, thread-safe LRU cache of parsed SEC public keys,
+  keyed by the raw SEC bytes. A capacity of 0 disables it.'''
+  def __init__(self, capacity=4096):
+    self.capacity = capacity
+    self.hits = 0
+    self.misses = 0
+    self.points = OrderedDict()
+    self.lock = threading.Lock()
+
+  def __len__(self):
+    return len(self.points)
+
+  def get(self, sec_bin):
+    with self.lock:
+      point = self.points.get(sec_bin)
+      if point is None:
+        self.misses += 1
+      else:
+        self.hits += 1
+        self.points.move_to_end(sec_bin)
+      return point
+
+  def put(self, sec_bin, point):
+    with self.lock:
+      if self.capacity <= 0:
+        return
+      self.points[sec_bin] = point
+      self.points.move_to_end(sec_bin)
+      while len(self.points) > self.capacity:
+        self.points.popitem(last=False)
+
+  def resize(self, capacity):
+    with self.lock:
+      self.capacity = capacity
+      while len(self.points) > max(capacity, 0):
+        self.points.popitem(last=False)
+
+  def clear(self):
+    with self.lock:
+      self.points.clear()
+      self.hits = 0
+      self.misses = 0
+
+  def stats(self):
+    with self.lock:
+      return {
+        'size': len(self.points),
+        'capacity': self.capacity,
+        'hits': self.hits,
+        'misses': self.misses,
+      }
+
+SEC_CACHE = SecCache()
+
 G = S256Point(
   0x79be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798,
   0x483ada7726a3c4655da4fbfc0e1108a8fd17b448a68554199c47d08ffb10d4b8
 )
 
+class GeneratorTable:
+  '''Fixed-window precomputation of multiples of G.
+  table[i][j] holds j * 2**(WINDOW*i) * G as affine Jacobian tuples, so a
+  generator multiplication is one mixed addition per window and no doublings.
+  The table is built lazily once per process or loaded from a file.'''
+  WINDOW = 8
+  table = None
+
+  @classmethod
+  def build(cls):
+    points = []
+    base = to_jacobian(G)
+    for _ in range(-(-256 // cls.WINDOW)):
+      current = INFINITY
+      for _ in range(1, 2**cls.WINDOW):
+        current = jacobian_add(current, base)
+        points.append(current)
+      base = jacobian_add(current, base)
+    affine = jacobian_to_affine_batch(points)
+    size = 2**cls.WINDOW - 1
+    return [
+      [INFINITY] + [(x, y, 1) for x, y in affine[i:i + size]]
+      for i in range(0, len(affine), size)
+    ]
+
+  @classmethod
+  def get(cls):
+    if cls.table is None:
+      cls.table = cls.build()
+    return cls.table
+
+  @classmethod
+  def multiply(cls, coefficient):
+    '''Returns coefficient * G in Jacobian coordinates'''
+    table = cls.get()
+    mask = 2**cls.WINDOW - 1
+    result = INFINITY
+    for row in table:
+      if coefficient == 0:
+        break
+      result = jacobian_add(result, row[coefficient & mask])
+      coefficient >>= cls.WINDOW
+    return result
+
+  @classmethod
+  def load_cache(cls, filename):
+    with open(filename, 'r') as f:
+      disk_cache = json.loads(f.read())
+    if disk_cache['window'] != cls.WINDOW:
+      raise ValueError(f'Table window {disk_cache["window"]} does not match {cls.WINDOW}')
+    raw_rows = disk_cache['rows']
+    if len(raw_rows) != -(-256 // cls.WINDOW):
+      raise ValueError(f'Table has {len(raw_rows)} rows, expected {-(-256 // cls.WINDOW)}')
+    rows = []
+    for raw_row in raw_rows:
+      if len(raw_row) != 2**cls.WINDOW - 1:
+        raise ValueError(f'Table row has {len(raw_row) + 1} entries, expected {2**cls.WINDOW}')
+      row = [INFINITY]
+      for raw_x, raw_y in raw_row:
+        x, y = int(raw_x, 16), int(raw_y, 16)
+        if (y * y - x * x * x - B) % P != 0:
+          raise ValueError(f'({x:x}, {y:x}) is not on the curve.')
+        row.append((x, y, 1))
+      rows.append(row)
+    if rows[0][1] != to_jacobian(G):
+      raise ValueError('Table does not start at G')
+    # every entry must be the previous one plus the row base, and each row
+    # base must follow on from the last entry of the row before it
+    previous = None
+    for row in rows:
+      base = row[1][:2]
+      if previous is not None and not is_affine_sum(previous[-1][:2], previous[1][:2], base):
+        raise ValueError('Table row does not follow the previous row')
+      for j in range(1, len(row) - 1):
+        if not is_affine_sum(row[j][:2], base, row[j + 1][:2]):
+          raise ValueError(f'Table entry {j + 1} is not a multiple of its row base')
+      previous = row
+    cls.table = rows
+
+  @classmethod
+  def dump_cache(cls, filename):
+    with open(filename, 'w') as f:
+      rows = [[(f'{x:064x}', f'{y:064x}') for x, y, _ in row[1:]] for row in cls.get()]
+      s = json.dumps({'window': cls.WINDOW, 'rows': rows})
+      f.write(s)
+
+def verify_batch(items):
+  '''Verifies many (point, z, Signature) triples together.
+  Returns a list of booleans, True where the signature is valid.
+
+  All the s inverses share one batched inversion, every u * G goes through
+  the GeneratorTable, and x(R) is compared projectively (X == r * Z^2) so no
+  affine conversion is needed.'''
+  items = list(items)
+  checked = [i for i, (_, _, sig) in enumerate(items) if 0 < sig.r < N and 0 < sig.s < N]
+  s_invs = batch_inverse([items[i][2].s for i in checked], N)
+  results = [False] * len(items)
+  for i, s_inv in zip(checked, s_invs):
+    point, z, sig = items[i]
+    u = z * s_inv % N
+    v = sig.r * s_inv % N
+    x, _, z_total = multi_multiply([(u, G), (v, point)], hot=True)
+    results[i] = z_total != 0 and x == sig.r * z_total * z_total % P
+  return results
+
+def schnorr_challenge(r, point, msg):
+  '''BIP340 challenge e = hash(R.x || P.x || msg) mod N'''
+  challenge = tagged_hash('BIP0340/challenge', r.to_bytes(32, 'big') + point.xonly() + msg)
+  return int.from_bytes(challenge, 'big') % N
+
+def verify_schnorr_batch(items):
+  '''Verifies many (point, msg, SchnorrSignature) triples with one
+  randomized multi-scalar multiplication:
+    (sum a_i*s_i) * G == sum a_i * R_i + sum a_i*e_i * P_i
+  with a_1 = 1 and a_i drawn from secrets, since weights an attacker can
+  predict let invalid signatures cancel out. Returns a list of booleans,
+  one per item; when the combined check fails every item is verified on
+  its own.'''
+  items = list(items)
+  pairs = []
+  generator = 0
+  try:
+    for i, (point, msg, sig) in enumerate(items):
+      if sig.r >= P or sig.s >= N:
+        raise ValueError('signature out of range')
+      key = point.even_y()
+      a = 1 if i == 0 else secrets.randbelow(N - 1) + 1
+      e = schnorr_challenge(sig.r, key, msg)
+      generator -= a * sig.s
+      pairs.append((a, S256Point.lift_x(sig.r)))
+      pairs.append((a * e, key))
+  except ValueError:
+    pairs = None
+  if pairs is not None and multi_multiply(pairs + [(generator, G)])[2] == 0:
+    return [True] * len(items)
+  return [point.verify_schnorr(msg, sig) for point, msg, sig in items]
+
 def der_preparation(i):
   i_bin = i.to_bytes(32, 'big')
   i_bin = i_bin.lstrip(b'\x00')
@@ -111,6 +810,23 @@ class Signature:
     result = bytes([2, len(r_bin)]) + r_bin + bytes([2, len(s_bin)]) + s_bin
     return bytes([0x30, len(result)]) + result
 
+  def compact(self, recid, compressed=True):
+    '''Returns the 65-byte compact (signed message) format'''
+    header = 27 + recid + (4 if compressed else 0)
+    return bytes([header]) + self.r.to_bytes(32, 'big') + self.s.to_bytes(32, 'big')
+
+  @classmethod
+  def parse_compact(cls, compact):
+    '''Returns (Signature, recid, compressed) from the compact format'''
+    if len(compact) != 65:
+      raise SyntaxError("Bad Compact Signature Length")
+    header = compact[0]
+    if header < 27 or header > 34:
+      raise SyntaxError("Bad Compact Signature Header")
+    r = int.from_bytes(compact[1:33], 'big')
+    s = int.from_bytes(compact[33:], 'big')
+    return cls(r, s), (header - 27) & 3, header >= 31
+
   @classmethod
   def parse(cls, signature_bin):
     s = BytesIO(signature_bin)
@@ -134,23 +850,59 @@ class Signature:
       raise SyntaxError("Signature too long")
     return cls(r, s)
 
+class SchnorrSignature:
+  '''BIP340 signature: r is the x coordinate of R'''
+  def __init__(self, r, s):
+    self.r = r
+    self.s = s
+
+  def __repr__(self):
+    return 'SchnorrSignature({:x}, {:x})'.format(self.r, self.s)
+
+  def serialize(self):
+    return self.r.to_bytes(32, 'big') + self.s.to_bytes(32, 'big')
+
+  @classmethod
+  def parse(cls, signature_bin):
+    if len(signature_bin) != 64:
+      raise SyntaxError("Bad Schnorr Signature Length")
+    r = int.from_bytes(signature_bin[:32], 'big')
+    s = int.from_bytes(signature_bin[32:], 'big')
+    return cls(r, s)
+
 class PrivateKey:
   def __init__(self, secret):
     self.secret = secret
     self.point = secret * G
+    self.nonce_state = None
+
+  def __getstate__(self):
+    # HMAC objects cannot be pickled, nonce_hmac rebuilds the state
+    state = dict(self.__dict__)
+    state['nonce_state'] = None
+    return state
 
   def hex(self):
     return '{:x}'.format(self.secret).zfill(64)
 
+  def nonce_hmac(self):
+    '''RFC6979 starts with HMAC(0x00*32, 0x01*32 || 0x00 || secret || z);
+    everything before z depends only on the key, so that state is kept.'''
+    if self.nonce_state is None:
+      secret_bytes = self.secret.to_bytes(32, 'big')
+      self.nonce_state = hmac.new(b'\x00' * 32, b'\x01' * 32 + b'\x00' + secret_bytes, hashlib.sha256)
+    return self.nonce_state.copy()
+
   def deterministic_k(self, z):
-    k = b'\x00' * 32
     v = b'\x01' * 32
     if z > N:
       z -= N
     z_bytes = z.to_bytes(32, 'big')
     secret_bytes = self.secret.to_bytes(32, 'big')
     s256 = hashlib.sha256
-    k = hmac.new(k, v + b'\x00' + secret_bytes + z_bytes, s256).digest()
+    k = self.nonce_hmac()
+    k.update(z_bytes)
+    k = k.digest()
     v = hmac.new(k, v, s256).digest()
     k = hmac.new(k, v + b'\x01' + secret_bytes + z_bytes, s256).digest()
     v = hmac.new(k, v, s256).digest()
@@ -161,20 +913,107 @@ class PrivateKey:
         return candidate
       k = hmac.new(k, v + b'\x00', s256).digest()
       v = hmac.new(k, v, s256).digest()
-      
+
   def sign(self, z):
-    k = self.deterministic_k(z)
-    r = (k*G).x.num
-    k_inv = pow(k, N-2, N)
-    s = (z + r * self.secret) * k_inv % N
-    if s > N/s:
-      s = N - s
-    return Signature(r, s)
+    return self.sign_many([z])[0]
+
+  def sign_many(self, zs, workers=None, chunk_size=256):
+    '''Signs every z, returning the same Signatures as calling sign on each.
+    All the k * G go through the generator table and share one batch
+    inversion, as do the k inverses. With workers=N the zs are split
+    across N processes.'''
+    zs = list(zs)
+    if workers and workers > 1 and len(zs) > chunk_size:
+      chunks = [zs[i:i + chunk_size] for i in range(0, len(zs), chunk_size)]
+      with ProcessPoolExecutor(max_workers=workers) as executor:
+        signed = executor.map(sign_chunk, [self.secret] * len(chunks), chunks)
+        return [sig for chunk in signed for sig in chunk]
+    ks = [self.deterministic_k(z) for z in zs]
+    r_points = jacobian_to_affine_batch([GeneratorTable.multiply(k) for k in ks])
+    k_invs = batch_inverse(ks, N)
+    result = []
+    for z, (r, _), k_inv in zip(zs, r_points, k_invs):
+      s = (z + r * self.secret) * k_inv % N
+      if s > N/s:
+        s = N - s
+      result.append(Signature(r, s))
+    return result
+
+  def sign_schnorr(self, msg, aux_rand=None):
+    '''BIP340 signature over msg bytes. aux_rand is 32 bytes of fresh
+    randomness; it defaults to os.urandom(32).'''
+    if aux_rand is None:
+      aux_rand = os.urandom(32)
+    secret = self.secret % N
+    if secret == 0:
+      raise ValueError('secret must not be a multiple of N')
+    if self.point.y.num % 2 != 0:
+      secret = N - secret
+    masked = secret ^ int.from_bytes(tagged_hash('BIP0340/aux', aux_rand), 'big')
+    nonce = tagged_hash('BIP0340/nonce', masked.to_bytes(32, 'big') + self.point.xonly() + msg)
+    k = int.from_bytes(nonce, 'big') % N
+    if k == 0:
+      raise RuntimeError('nonce is zero, use another aux_rand')
+    r, y = jacobian_to_affine(GeneratorTable.multiply(k))
+    if y % 2 != 0:
+      k = N - k
+    e = schnorr_challenge(r, self.point, msg)
+    return SchnorrSignature(r, (k + e * secret) % N)
+
+  def sign_compact(self, z, compressed=True):
+    '''Signs z and returns the 65-byte compact signature with recovery id'''
+    sig = self.sign(z)
+    for recid in range(4):
+      try:
+        if S256Point.recover(z, sig, recid) == self.point:
+          return sig.compact(recid, compressed)
+      except ValueError:
+        continue
+    raise RuntimeError('no recovery id reproduces the key')
 
   def wif(self, compressed=True, testnet=False):
     secret_bytes = self.secret.to_bytes(32, 'big')
     prefix = b'\xef' if testnet else b'\x80'
     suffix = b'\x01' if compressed else b''
     return encode_base58_checksum(prefix + secret_bytes + suffix)
-  
 
+def sign_chunk(secret, zs):
+  '''Process pool entry point for PrivateKey.sign_many'''
+  return PrivateKey(secret).sign_many(zs)
+
+def derive_points(secrets, chunk_size=256):
+  '''Yields secret * G for every secret, chunk_size points at a time.
+  A secret that is one more than the previous one costs a single mixed
+  addition; every chunk is converted to affine with one inversion.'''
+  generator = to_jacobian(G)
+  previous_secret = None
+  previous = INFINITY
+  chunk = []
+  for secret in secrets:
+    secret %= N
+    if secret == 0:
+      raise ValueError('secret must not be a multiple of N')
+    if previous_secret is not None and secret == previous_secret + 1:
+      previous = jacobian_add(previous, generator)
+    else:
+      previous = GeneratorTable.multiply(secret)
+    previous_secret = secret
+    chunk.append(previous)
+    if len(chunk) == chunk_size:
+      yield from S256Point.normalize_batch(chunk)
+      chunk = []
+  if chunk:
+    yield from S256Point.normalize_batch(chunk)
+
+def derive_addresses(secrets, compressed=True, testnet=False, chunk_size=256):
+  '''Yields the address of PrivateKey(secret) for every secret, in order.
+  secrets can be any iterable (e.g. a range); nothing is held in memory
+  beyond the current chunk.'''
+  prefix = b'\x6f' if testnet else b'\x00'
+  payloads = []
+  for point in derive_points(secrets, chunk_size):
+    payloads.append(prefix + point.hash160(compressed))
+    if len(payloads) == chunk_size:
+      yield from encode_base58_checksum_many(payloads)
+      payloads = []
+  yield from encode_base58_checksum_many(payloads)
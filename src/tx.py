@@ -1,8 +1,12 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from io import BytesIO
+from operator import attrgetter
 from unittest import TestCase
 
+import hashlib
 import json
 import requests
+import struct
 
 from .helper import (
   encode_varint,
@@ -10,9 +14,20 @@ from .helper import (
   int_to_little_endian,
   little_endian_to_int,
   read_varint,
+  read_varint_at,
   SIGHASH_ALL
 )
-from .script import Script
+from .script import Script, p2pkh_script, parse_cmds
+from .secp256k1 import verify_batch
+
+# fixed-size fields for the memoryview parser
+OUTPOINT = struct.Struct('<32sI')
+UINT32 = struct.Struct('<I')
+UINT64 = struct.Struct('<Q')
+# the memoized serialization of a Tx, TxIn or TxOut
+RAW = attrgetter('raw')
+# outpoint, empty scriptSig and sequence
+EMPTY_TX_IN = 41
 
 class TxFetcher:
   cache = {}
@@ -33,12 +48,7 @@ class TxFetcher:
         raw = bytes.fromhex(response.text.strip())
       except ValueError:
         raise ValueError(f'Unexpected Response: {response.text}')
-      if raw[4] == 0:
-        raw = raw[:4] + raw[6:]
-        tx = Tx.parse(BytesIO(raw), testnet=testnet)
-        tx.locktime = little_endian_to_int(raw[-4:])
-      else:
-        tx = Tx.parse(BytesIO(raw), testnet=testnet)
+      tx = Tx.parse_bytes(raw, testnet=testnet)
       if tx.id() != tx_id:
         raise ValueError(f'Not the same id: {tx.id} vs {tx_id}')
       cls.cache[tx_id] = tx
@@ -49,14 +59,7 @@ class TxFetcher:
   def load_cache(cls, filename):
     disk_cache = json.loads(open(filename, 'r').read())
     for k, raw_hex in disk_cache.items():
-      raw = bytes.fromhex(raw_hex)
-      if raw[4] == 0:
-        raw = raw[:4] + raw[6:]
-        tx = Tx.parse(BytesIO(raw))
-        tx.locktime = little_endian_to_int(raw[-4:])
-      else:
-        tx = Tx.parse(BytesIO(raw))
-      cls.cache[k] = tx
+      cls.cache[k] = Tx.parse_bytes(bytes.fromhex(raw_hex))
 
   @classmethod
   def dump_cache(cls, filename):
@@ -66,12 +69,36 @@ class TxFetcher:
       f.write(s)
 
 class Tx:
-  def __init__(self, version, tx_ins, tx_outs, locktime, testnet=False):
+  # assigning any of these drops the memoized serialization and hash
+  fields = ('version', 'tx_ins', 'tx_outs', 'locktime')
+
+  def __init__(self, version, tx_ins, tx_outs, locktime, testnet=False, segwit=False):
+    self.raw = None
+    self.parts = ()
+    self.tx_hash = None
     self.version = version
     self.tx_ins = tx_ins
     self.tx_outs = tx_outs
     self.locktime = locktime
     self.testnet = testnet
+    self.segwit = segwit
+    self.bip143 = None
+    self.sighash_context = None
+
+  def __setattr__(self, name, value):
+    if name in self.fields:
+      super().__setattr__('raw', None)
+    super().__setattr__(name, value)
+
+  def __getstate__(self):
+    # memoryviews into the parsed buffer cannot be pickled
+    state = dict(self.__dict__)
+    state['raw'] = None
+    state['parts'] = ()
+    state['tx_hash'] = None
+    state['bip143'] = None
+    state['sighash_context'] = None
+    return state
 
   def __repr__(self):
     tx_ins = ''
@@ -86,10 +113,30 @@ class Tx:
     '''Human-readable hexadecimal of the transaction hash'''
     return self.hash().hex()
 
-  def hash(self):
-    '''Binary hash of the legacy serialization'''
+  def wtxid(self):
+    '''Human-readable hexadecimal of the witness transaction hash'''
+    return self.witness_hash().hex()
+
+  def witness_hash(self):
+    '''Binary hash of the BIP144 serialization (witness included)'''
     return hash256(self.serialize())[::-1]
 
+  def weight(self):
+    '''BIP141 weight: 3 * legacy size + full size'''
+    return 3 * len(self.raw_bytes()) + len(self.serialize())
+
+  def vsize(self):
+    '''Virtual size in vbytes, weight / 4 rounded up'''
+    return -(-self.weight() // 4)
+
+  def hash(self):
+    '''Binary hash of the legacy serialization, memoized
+    as long as the serialization is unchanged'''
+    raw = self.raw_bytes()
+    if self.tx_hash is None or self.tx_hash[0] is not raw:
+      self.tx_hash = (raw, hash256(raw)[::-1])
+    return self.tx_hash[1]
+
   @classmethod
   def parse(cls, s, testnet=False):
     '''Takes a byte stream and parses the tx_input at the start
@@ -97,6 +144,12 @@ class Tx:
     '''
     version = little_endian_to_int(s.read(4))
     num_inputs = read_varint(s)
+    # BIP144: a zero input count is the segwit marker, followed by flag 1
+    segwit = num_inputs == 0
+    if segwit:
+      if s.read(1) != b'\x01':
+        raise SyntaxError('Bad segwit flag.')
+      num_inputs = read_varint(s)
     inputs = []
     for _ in range(num_inputs):
       inputs.append(TxIn.parse(s))
@@ -104,20 +157,117 @@ class Tx:
     outputs = []
     for _ in range(num_outputs):
       outputs.append(TxOut.parse(s))
+    if segwit:
+      for tx_in in inputs:
+        tx_in.witness = [s.read(read_varint(s)) for _ in range(read_varint(s))]
     locktime = little_endian_to_int(s.read(4))
-    return cls(version, inputs, outputs, locktime, testnet=testnet)
+    return cls(version, inputs, outputs, locktime, testnet=testnet, segwit=segwit)
+
+  @classmethod
+  def parse_view(cls, buf, offset=0, testnet=False):
+    '''Parses a transaction from a memoryview at offset.
+    Scripts keep a view into buf and are only parsed when their cmds are
+    used. Returns (Tx, offset just past it).'''
+    start = offset
+    try:
+      version, = UINT32.unpack_from(buf, offset)
+      num_inputs, offset = read_varint_at(buf, offset + 4)
+      segwit = num_inputs == 0
+      if segwit:
+        if buf[offset] != 1:
+          raise SyntaxError('Bad segwit flag.')
+        num_inputs, offset = read_varint_at(buf, offset + 1)
+      inputs = []
+      for _ in range(num_inputs):
+        tx_in, offset = TxIn.parse_view(buf, offset)
+        inputs.append(tx_in)
+      num_outputs, offset = read_varint_at(buf, offset)
+      outputs = []
+      for _ in range(num_outputs):
+        tx_out, offset = TxOut.parse_view(buf, offset)
+        outputs.append(tx_out)
+      if segwit:
+        for tx_in in inputs:
+          count, offset = read_varint_at(buf, offset)
+          witness = []
+          for _ in range(count):
+            length, offset = read_varint_at(buf, offset)
+            if offset + length > len(buf):
+              raise SyntaxError('Parsing witness Failed.')
+            witness.append(bytes(buf[offset:offset + length]))
+            offset += length
+          tx_in.witness = witness
+      locktime, = UINT32.unpack_from(buf, offset)
+    except (struct.error, IndexError):
+      raise SyntaxError('Parsing Tx Failed.')
+    tx = cls(version, inputs, outputs, locktime, testnet=testnet, segwit=segwit)
+    if not segwit:
+      # the legacy serialization is only contiguous without witness data
+      tx.raw = buf[start:offset + 4]
+      tx.parts = tuple(item.raw for item in inputs + outputs)
+    return tx, offset + 4
+
+  @classmethod
+  def parse_bytes(cls, buf, testnet=False):
+    '''Parses a single serialized transaction without copying it'''
+    buf = memoryview(buf)
+    tx, offset = cls.parse_view(buf, 0, testnet=testnet)
+    if offset != len(buf):
+      raise SyntaxError('Trailing bytes after Tx.')
+    return tx
+
+  @classmethod
+  def parse_many(cls, buf, testnet=False):
+    '''Parses back to back serialized transactions, e.g. the
+    transactions of a block after their count, until buf runs out'''
+    buf = memoryview(buf)
+    offset = 0
+    txs = []
+    while offset < len(buf):
+      tx, offset = cls.parse_view(buf, offset, testnet=testnet)
+      txs.append(tx)
+    return txs
 
   def serialize(self):
-    '''Retuns the byte serialization of the transaction'''
-    result = int_to_little_endian(self.version, 4)
-    result += encode_varint(len(self.tx_ins))
+    '''Retuns the byte serialization of the transaction,
+    in the BIP144 format with witness data for segwit transactions'''
+    if not self.segwit:
+      return bytes(self.raw_bytes())
+    raw = self.raw_bytes()
+    result = [raw[:4], b'\x00\x01', raw[4:-4]]
     for tx_in in self.tx_ins:
-      result += tx_in.serialize()
-    result += encode_varint(len(self.tx_outs))
-    for tx_out in self.tx_outs:
-      result += tx_out.serialize()
-    result += int_to_little_endian(self.locktime, 4)
-    return result
+      result.append(encode_varint(len(tx_in.witness)))
+      for item in tx_in.witness:
+        result.append(encode_varint(len(item)))
+        result.append(item)
+    result.append(raw[-4:])
+    return b''.join(result)
+
+  def serialize_legacy(self):
+    '''Returns the serialization without witness data, used for the txid'''
+    return bytes(self.raw_bytes())
+
+  def raw_bytes(self):
+    '''Returns the memoized serialization (bytes or a memoryview into the
+    parsed buffer). It is rebuilt when a field was assigned or when any
+    TxIn/TxOut was replaced or changed its own serialization.
+    Scripts are not watched: replace a script instead of editing its cmds.'''
+    if self.raw is not None and self.parts == \
+        tuple(map(RAW, self.tx_ins)) + tuple(map(RAW, self.tx_outs)):
+      return self.raw
+    parts = tuple(tx_in.raw_bytes() for tx_in in self.tx_ins) \
+        + tuple(tx_out.raw_bytes() for tx_out in self.tx_outs)
+    if self.raw is None or parts != self.parts:
+      inputs = len(self.tx_ins)
+      result = int_to_little_endian(self.version, 4)
+      result += encode_varint(inputs)
+      result += b''.join(parts[:inputs])
+      result += encode_varint(len(self.tx_outs))
+      result += b''.join(parts[inputs:])
+      result += int_to_little_endian(self.locktime, 4)
+      self.raw = result
+      self.parts = parts
+    return self.raw
 
   def fee(self):
     input_sum = 0
@@ -129,6 +279,46 @@ class Tx:
     return input_sum - output_sum
 
   def sig_hash(self, input_index, redeem_script=None):
+    '''Legacy SIGHASH_ALL sig hash. Splices the input's script into the
+    cached context from legacy_sighash_context instead of re-serializing
+    the transaction; sig_hash_reference is the straightforward version.'''
+    midstates, tail = self.legacy_sighash_context()
+    if redeem_script:
+      script_sig = redeem_script
+    else:
+      script_sig = self.tx_ins[input_index].script_pubkey(self.testnet)
+    raw = self.parts[input_index]
+    h = midstates[input_index].copy()
+    h.update(raw[:36])
+    h.update(script_sig.serialize())
+    h.update(raw[-4:])
+    h.update(tail[EMPTY_TX_IN * (input_index + 1):])
+    return int.from_bytes(hashlib.sha256(h.digest()).digest(), 'big')
+
+  def legacy_sighash_context(self):
+    '''Precomputes what every legacy sig hash shares: all inputs encoded
+    with an empty scriptSig followed by the outputs, locktime and hash
+    type, plus the SHA-256 state after the prefix up to each input.
+    Kept until an input or output changes, like bip143_hashes.'''
+    self.raw_bytes()
+    if self.sighash_context is None or self.sighash_context[0] is not self.parts:
+      inputs = self.parts[:len(self.tx_ins)]
+      empty = [b''.join((raw[:36], b'\x00', raw[-4:])) for raw in inputs]
+      tail = b''.join(empty)
+      tail += encode_varint(len(self.tx_outs))
+      tail += b''.join(self.parts[len(self.tx_ins):])
+      tail += int_to_little_endian(self.locktime, 4)
+      tail += int_to_little_endian(SIGHASH_ALL, 4)
+      h = hashlib.sha256(int_to_little_endian(self.version, 4) + encode_varint(len(inputs)))
+      midstates = []
+      for encoding in empty:
+        midstates.append(h.copy())
+        h.update(encoding)
+      self.sighash_context = (self.parts, (midstates, memoryview(tail)))
+    return self.sighash_context[1]
+
+  def sig_hash_reference(self, input_index, redeem_script=None):
+    '''Builds the whole sig hash preimage from fresh TxIns'''
     s = int_to_little_endian(self.version, 4)
     s += encode_varint(len(self.tx_ins))
     for i, tx_in in enumerate(self.tx_ins):
@@ -153,20 +343,103 @@ class Tx:
     h256 = hash256(s)
     return int.from_bytes(h256, 'big')
 
-  def verify_input(self, input_index):
+  def bip143_hashes(self):
+    '''Returns (hashPrevouts, hashSequence, hashOutputs) for BIP143.
+    They are computed once and reused for every input until an input
+    or output changes.'''
+    self.raw_bytes()
+    if self.bip143 is None or self.bip143[0] is not self.parts:
+      inputs = self.parts[:len(self.tx_ins)]
+      outputs = self.parts[len(self.tx_ins):]
+      hashes = (
+        hash256(b''.join(raw[:36] for raw in inputs)),
+        hash256(b''.join(raw[-4:] for raw in inputs)),
+        hash256(b''.join(outputs)),
+      )
+      self.bip143 = (self.parts, hashes)
+    return self.bip143[1]
+
+  def sig_hash_bip143(self, input_index, redeem_script=None, witness_script=None):
+    '''BIP143 sig hash of a segwit input for SIGHASH_ALL.
+    witness_script is needed for p2wsh, redeem_script for p2sh-wrapped
+    p2wpkh; native p2wpkh needs neither. witness_script can be the raw
+    bytes from the witness, which are committed to exactly as they are.'''
+    tx_in = self.tx_ins[input_index]
+    hash_prevouts, hash_sequence, hash_outputs = self.bip143_hashes()
+    if isinstance(witness_script, (bytes, bytearray)):
+      script_code = encode_varint(len(witness_script)) + witness_script
+    elif witness_script is not None:
+      script_code = witness_script.serialize()
+    elif redeem_script is not None:
+      script_code = p2pkh_script(redeem_script.cmds[1]).serialize()
+    else:
+      script_code = p2pkh_script(tx_in.script_pubkey(self.testnet).cmds[1]).serialize()
+    s = int_to_little_endian(self.version, 4)
+    s += hash_prevouts + hash_sequence
+    s += tx_in.prev_tx[::-1] + int_to_little_endian(tx_in.prev_index, 4)
+    s += script_code
+    s += int_to_little_endian(tx_in.value(self.testnet), 8)
+    s += int_to_little_endian(tx_in.sequence, 4)
+    s += hash_outputs
+    s += int_to_little_endian(self.locktime, 4)
+    s += int_to_little_endian(SIGHASH_ALL, 4)
+    return int.from_bytes(hash256(s), 'big')
+
+  def prepare_input(self, input_index):
+    '''Looks up the prevout and computes the sig hash.
+    Returns the (combined script, z) pair that verify_input evaluates.
+    Segwit inputs get their witness program spelled out as a script.'''
     tx_in = self.tx_ins[input_index]
     script_pubkey = tx_in.script_pubkey(testnet=self.testnet)
     if script_pubkey.is_p2sh_script_pubkey():
       cmd = tx_in.script_sig.cmds[-1]
       raw_redeem = encode_varint(len(cmd)) + cmd
       redeem_script = Script.parse(BytesIO(raw_redeem))
+      if redeem_script.is_p2wpkh_script_pubkey() or redeem_script.is_p2wsh_script_pubkey():
+        # check the redeem script hash without the p2sh special case,
+        # then run its witness program
+        prefix = Script(tx_in.script_sig.cmds + [0xa9, script_pubkey.cmds[1], 0x88])
+        return self.prepare_witness(input_index, redeem_script, prefix, redeem_script)
+    elif script_pubkey.is_p2wpkh_script_pubkey() or script_pubkey.is_p2wsh_script_pubkey():
+      return self.prepare_witness(input_index, script_pubkey, tx_in.script_sig)
     else:
       redeem_script = None
     z = self.sig_hash(input_index, redeem_script)
     combined = tx_in.script_sig + script_pubkey
-    return combined.evaluate(z)
+    return combined, z
 
-  def verify(self):
+  def prepare_witness(self, input_index, program_script, prefix, redeem_script=None):
+    '''(combined script, z) for a v0 witness program: p2wpkh runs the
+    witness against the matching p2pkh script, p2wsh checks the sha256 of
+    the last witness item and then runs it as the witness script.'''
+    witness = self.tx_ins[input_index].witness
+    program = program_script.cmds[1]
+    if len(program) == 20:
+      z = self.sig_hash_bip143(input_index, redeem_script=redeem_script or program_script)
+      return prefix + Script(list(witness)) + p2pkh_script(program), z
+    if not witness:
+      # nothing to run: a script that leaves an empty element fails
+      return Script([0x00]), 0
+    # the sig hash commits to the witness script bytes as given, so a
+    # non-minimal push must not be re-serialized before hashing
+    try:
+      witness_script = Script(parse_cmds(witness[-1]))
+    except SyntaxError:
+      return Script([0x00]), 0
+    z = self.sig_hash_bip143(input_index, witness_script=bytes(witness[-1]))
+    check = Script(list(witness) + [0xa8, program, 0x88])
+    return prefix + check + witness_script, z
+
+  def verify_input(self, input_index, deferred=None):
+    combined, z = self.prepare_input(input_index)
+    return combined.evaluate(z, deferred)
+
+  def verify(self, batch=False, workers=None):
+    '''With batch=True the OP_CHECKSIG signatures of all inputs are
+    collected and checked together with verify_batch.
+    With workers=N the inputs are spread over N processes.'''
+    if batch or workers:
+      return verify_many([self], workers=workers)
     if self.fee() < 0:
       return False
     for i in range(len(self.tx_ins)):
@@ -175,13 +448,21 @@ class Tx:
     return True
 
   def sign_input(self, input_index, private_key):
-    '''Signs the input using the private key'''
-    z = self.sig_hash(input_index)
+    '''Signs the input using the private key.
+    p2wpkh prevouts are signed with the BIP143 sig hash into the witness.'''
+    tx_in = self.tx_ins[input_index]
+    if tx_in.script_pubkey(self.testnet).is_p2wpkh_script_pubkey():
+      z = self.sig_hash_bip143(input_index)
+    else:
+      z = self.sig_hash(input_index)
     der = private_key.sign(z).der()
     sig = der + SIGHASH_ALL.to_bytes(1, 'big')
     sec = private_key.point.sec()
-    script_sig = Script([sig, sec])
-    self.tx_ins[input_index].script_sig = script_sig
+    if tx_in.script_pubkey(self.testnet).is_p2wpkh_script_pubkey():
+      tx_in.witness = [sig, sec]
+      self.segwit = True
+    else:
+      tx_in.script_sig = Script([sig, sec])
     return self.verify_input(input_index)
 
   def is_coinbase(self):
@@ -201,7 +482,10 @@ class Tx:
     return little_endian_to_int(element)
 
 class TxIn:
-  def __init__(self, prev_tx, prev_index, script_sig=None, sequence=0xffffffff):
+  fields = ('prev_tx', 'prev_index', 'script_sig', 'sequence')
+
+  def __init__(self, prev_tx, prev_index, script_sig=None, sequence=0xffffffff, witness=None):
+    self.raw = None
     self.prev_tx = prev_tx
     self.prev_index = prev_index
     if script_sig is None:  
@@ -209,6 +493,22 @@ class TxIn:
     else:
       self.script_sig = script_sig
     self.sequence = sequence
+    # witness stack items (bytes); not part of the legacy serialization
+    if witness is None:
+      self.witness = []
+    else:
+      self.witness = witness
+
+  def __setattr__(self, name, value):
+    if name in self.fields:
+      super().__setattr__('raw', None)
+    super().__setattr__(name, value)
+
+  def __getstate__(self):
+    # memoryviews into the parsed buffer cannot be pickled
+    state = dict(self.__dict__)
+    state['raw'] = None
+    return state
 
   def __repr__(self):
     return f'{self.prev_tx.hex()}:{self.prev_index}'
@@ -224,13 +524,31 @@ class TxIn:
     sequence = little_endian_to_int(s.read(4))
     return cls(prev_tx, prev_index, script_sig, sequence)
 
+  @classmethod
+  def parse_view(cls, buf, offset):
+    '''Parses a tx_input from a memoryview at offset.
+    Returns (TxIn, offset just past it).'''
+    start = offset
+    prev_tx, prev_index = OUTPOINT.unpack_from(buf, offset)
+    script_sig, offset = Script.parse_view(buf, offset + 36)
+    sequence, = UINT32.unpack_from(buf, offset)
+    tx_in = cls(prev_tx[::-1], prev_index, script_sig, sequence)
+    tx_in.raw = buf[start:offset + 4]
+    return tx_in, offset + 4
+
   def serialize(self):
     '''Returns the byte serialization of the transaction input'''
-    result = self.prev_tx[::-1]
-    result += int_to_little_endian(self.prev_index, 4)
-    result += self.script_sig.serialize()
-    result += int_to_little_endian(self.sequence, 4)
-    return result
+    return bytes(self.raw_bytes())
+
+  def raw_bytes(self):
+    '''Returns the memoized serialization, see Tx.raw_bytes'''
+    if self.raw is None:
+      result = self.prev_tx[::-1]
+      result += int_to_little_endian(self.prev_index, 4)
+      result += self.script_sig.serialize()
+      result += int_to_little_endian(self.sequence, 4)
+      self.raw = result
+    return self.raw
 
   def fetch_tx(self, testnet=False):
     return TxFetcher.fetch(self.prev_tx.hex(), testnet=testnet)
@@ -250,10 +568,24 @@ class TxIn:
     return tx.tx_outs[self.prev_index].script_pubkey
 
 class TxOut:
+  fields = ('amount', 'script_pubkey')
+
   def __init__(self, amount, script_pubkey):
+    self.raw = None
     self.amount = amount
     self.script_pubkey = script_pubkey
 
+  def __setattr__(self, name, value):
+    if name in self.fields:
+      super().__setattr__('raw', None)
+    super().__setattr__(name, value)
+
+  def __getstate__(self):
+    # memoryviews into the parsed buffer cannot be pickled
+    state = dict(self.__dict__)
+    state['raw'] = None
+    return state
+
   def __repr__(self):
     return f'{self.amount}: {self.script_pubkey}'
 
@@ -266,8 +598,58 @@ class TxOut:
     script_pubkey = Script.parse(s)
     return cls(amount, script_pubkey)
 
+  @classmethod
+  def parse_view(cls, buf, offset):
+    '''Parses a tx_output from a memoryview at offset.
+    Returns (TxOut, offset just past it).'''
+    amount, = UINT64.unpack_from(buf, offset)
+    script_pubkey, end = Script.parse_view(buf, offset + 8)
+    tx_out = cls(amount, script_pubkey)
+    tx_out.raw = buf[offset:end]
+    return tx_out, end
+
   def serialize(self):
     '''Retusn the byte serialization of the transaction output'''
-    result = int_to_little_endian(self.amount, 8)
-    result += self.script_pubkey.serialize()
-    return result
\ No newline at end of file
+    return bytes(self.raw_bytes())
+
+  def raw_bytes(self):
+    '''Returns the memoized serialization, see Tx.raw_bytes'''
+    if self.raw is None:
+      result = int_to_little_endian(self.amount, 8)
+      result += self.script_pubkey.serialize()
+      self.raw = result
+    return self.raw
+
+def evaluate_inputs(jobs):
+  '''Evaluates (combined script, z) pairs from Tx.prepare_input, checking all
+  the deferred OP_CHECKSIG signatures with a single verify_batch call.
+  Scripts are first run assuming each signature is valid. That is exact
+  when they all are; otherwise everything is re-run one by one.'''
+  deferred = []
+  passed = all(combined.evaluate(z, deferred) for combined, z in jobs)
+  if all(verify_batch(deferred)):
+    return passed
+  return all(combined.evaluate(z) for combined, z in jobs)
+
+def verify_many(txs, workers=None, chunk_size=32):
+  '''Verifies every input of every transaction.
+  Prevouts and sig hashes are resolved here, in the calling process, so
+  with workers=N the worker processes only run scripts and never need
+  TxFetcher. The first failing chunk cancels the rest.'''
+  txs = list(txs)
+  for tx in txs:
+    if tx.fee() < 0:
+      return False
+  jobs = [tx.prepare_input(i) for tx in txs for i in range(len(tx.tx_ins))]
+  if not workers or workers < 2 or len(jobs) < 2:
+    return evaluate_inputs(jobs)
+  chunk_size = max(1, min(chunk_size, -(-len(jobs) // workers)))
+  chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+  with ProcessPoolExecutor(max_workers=workers) as executor:
+    futures = [executor.submit(evaluate_inputs, chunk) for chunk in chunks]
+    for future in as_completed(futures):
+      if not future.result():
+        for pending in futures:
+          pending.cancel()
+        return False
+  return True
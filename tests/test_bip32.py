@@ -0,0 +1,64 @@
+from unittest import TestCase
+
+from src.bip32 import ExtendedKey, HARDENED, parse_path
+
+class ExtendedKeyTest(TestCase):
+  seed = bytes.fromhex('000102030405060708090a0b0c0d0e0f')
+
+  def test_vector_1(self):
+    vectors = (
+      ('m',
+        'xprv9s21ZrQH143K3QTDL4LXw2F7HEK3wJUD2nW2nRk4stbPy6cq3jPPqjiChkVvvNKmPGJxWUtg6LnF5kejMRNNU3TGtRBeJgk33yuGBxrMPHi',
+        'xpub661MyMwAqRbcFtXgS5sYJABqqG9YLmC4Q1Rdap9gSE8NqtwybGhePY2gZ29ESFjqJoCu1Rupje8YtGqsefD265TMg7usUDFdp6W1EGMcet8'),
+      ("m/0'",
+        'xprv9uHRZZhk6KAJC1avXpDAp4MDc3sQKNxDiPvvkX8Br5ngLNv1TxvUxt4cV1rGL5hj6KCesnDYUhd7oWgT11eZG7XnxHrnYeSvkzY7d2bhkJ7',
+        'xpub68Gmy5EdvgibQVfPdqkBBCHxA5htiqg55crXYuXoQRKfDBFA1WEjWgP6LHhwBZeNK1VTsfTFUHCdrfp1bgwQ9xv5ski8PX9rL2dZXvgGDnw'),
+      ("m/0'/1",
+        'xprv9wTYmMFdV23N2TdNG573QoEsfRrWKQgWeibmLntzniatZvR9BmLnvSxqu53Kw1UmYPxLgboyZQaXwTCg8MSY3H2EU4pWcQDnRnrVA1xe8fs',
+        'xpub6ASuArnXKPbfEwhqN6e3mwBcDTgzisQN1wXN9BJcM47sSikHjJf3UFHKkNAWbWMiGj7Wf5uMash7SyYq527Hqck2AxYysAA7xmALppuCkwQ'),
+      ("m/0h/1/2h",
+        'xprv9z4pot5VBttmtdRTWfWQmoH1taj2axGVzFqSb8C9xaxKymcFzXBDptWmT7FwuEzG3ryjH4ktypQSAewRiNMjANTtpgP4mLTj34bhnZX7UiM',
+        'xpub6D4BDPcP2GT577Vvch3R8wDkScZWzQzMMUm3PWbmWvVJrZwQY4VUNgqFJPMM3No2dFDFGTsxxpG5uJh7n7epu4trkrX7x7DogT5Uv6fcLW5'),
+    )
+    master = ExtendedKey.from_seed(self.seed)
+    for path, xprv, xpub in vectors:
+      key = master.derive(path)
+      self.assertEqual(key.xprv(), xprv)
+      self.assertEqual(key.xpub(), xpub)
+      self.assertEqual(ExtendedKey.parse(xprv).xprv(), xprv)
+      self.assertEqual(ExtendedKey.parse(xpub).xpub(), xpub)
+
+  def test_parse_path(self):
+    self.assertEqual(parse_path("m/44'/0h/5"), (44 + HARDENED, HARDENED, 5))
+    self.assertEqual(parse_path('m'), ())
+    with self.assertRaises(ValueError):
+      parse_path('44/0')
+
+  def test_public_derivation(self):
+    account = ExtendedKey.from_seed(self.seed).derive("m/44'/0'/0'")
+    public = account.neuter()
+    self.assertEqual(public.derive('m/0/7').xpub(), account.derive('m/0/7').xpub())
+    with self.assertRaises(ValueError):
+      public.child(HARDENED)
+
+  def test_derive_range(self):
+    account = ExtendedKey.from_seed(self.seed).derive("m/44'/0'/0'")
+    external = account.derive('m/0')
+    keys = external.derive_range(3, 4)
+    self.assertEqual([k.child_number for k in keys], [3, 4, 5, 6])
+    for key in keys:
+      self.assertEqual(key.xprv(), account.derive(f'm/0/{key.child_number}').xprv())
+      self.assertEqual(key.private_key().point, key.point)
+    public_keys = external.neuter().derive_range(3, 4)
+    self.assertEqual([k.xpub() for k in public_keys], [k.xpub() for k in keys])
+
+  def test_node_cache(self):
+    master = ExtendedKey.from_seed(self.seed)
+    first = master.derive("m/44'/0'/0'/0/1")
+    external = master.children[44 + HARDENED].children[HARDENED].children[HARDENED].children[0]
+    second = master.derive("m/44'/0'/0'/0/2")
+    self.assertIs(master.children[44 + HARDENED].children[HARDENED].children[HARDENED].children[0], external)
+    self.assertEqual(first.parent_fingerprint, second.parent_fingerprint)
+    self.assertEqual(external.children, {})
+    master.clear_cache()
+    self.assertEqual(master.children, {})
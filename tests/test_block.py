@@ -1,7 +1,8 @@
 from unittest import TestCase
 from io import BytesIO
 
-from src.block import Block
+from src.block import Block, GENESIS_BLOCK, check_pow_many
+from src.helper import little_endian_to_int
 
 class BlockTest(TestCase):
   def test_parse(self):
@@ -82,6 +83,38 @@ class BlockTest(TestCase):
     block = Block.parse(stream)
     self.assertFalse(block.check_pow())
 
+  def test_check_pow_many(self):
+    block_raw = bytes.fromhex('04000000fbedbbf0cfdaf278c094f187f2eb987c86a199da22bbb20400000000000000007b7697b29129648fa08b4bcd13c9d5e60abb973a1efac9c8d573c71c807c56c3d6213557faa80518c3737ec1')
+    bad_raw = block_raw[:-1] + b'\xc0'
+    blocks = [Block.parse(BytesIO(raw)) for raw in (block_raw, bad_raw, GENESIS_BLOCK)]
+    want = [True, False, True]
+    self.assertEqual([b.check_pow() for b in blocks], want)
+    self.assertEqual(check_pow_many(blocks), want)
+    self.assertEqual(check_pow_many(block_raw + bad_raw + GENESIS_BLOCK), want)
+    self.assertEqual(check_pow_many(b''), [])
+    with self.assertRaises(ValueError):
+      check_pow_many(block_raw[:-1])
+
+  def test_mine(self):
+    block_raw = bytes.fromhex('04000000fbedbbf0cfdaf278c094f187f2eb987c86a199da22bbb20400000000000000007b7697b29129648fa08b4bcd13c9d5e60abb973a1efac9c8d573c71c807c56c3d6213557faa80518c3737ec1')
+    block = Block.parse(BytesIO(block_raw))
+    want = block.nonce
+    block.nonce = bytes(4)
+    start = little_endian_to_int(want) - 500
+    nonce, rate = block.mine(start, 1000)
+    self.assertEqual(nonce, start + 500)
+    self.assertEqual(block.nonce, want)
+    self.assertGreater(rate, 0)
+    self.assertTrue(block.check_pow())
+    self.assertEqual(block.mine(0, 100)[0], None)
+    self.assertEqual(block.nonce, want)
+    nonce, _ = block.mine(start, 1000, workers=2, chunk_size=300)
+    self.assertEqual(nonce, start + 500)
+    nonce, _ = block.mine(start + 500 - 990, 1000, workers=2, chunk_size=100)
+    self.assertEqual(nonce, start + 500)
+    with self.assertRaises(ValueError):
+      block.mine(2**32 - 10, 11)
+
 def test_validate_merkle_root(self):
     hashes_hex = [
       'f54cb69e5dc1bd38ee6901e4ec2007a5030e14bdd60afb4d2f3428c88eea17c1',
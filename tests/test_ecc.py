@@ -1,4 +1,4 @@
-from src.ecc import FieldElement, Point   
+from src.ecc import FieldElement, Point, batch_inverse
 from unittest import TestCase
 
 class FieldElementTest(TestCase):
@@ -48,6 +48,13 @@ class FieldElementTest(TestCase):
     b = FieldElement(11, 31)
     self.assertEqual(a**-4 * b, FieldElement(13, 31))
 
+  def test_batch_inverse(self):
+    prime = 223
+    nums = [1, 2, 17, 222, 100]
+    for num, inverse in zip(nums, batch_inverse(nums, prime)):
+      self.assertEqual(num * inverse % prime, 1)
+    self.assertEqual(batch_inverse([], prime), [])
+
 class PointTest(TestCase):
   def test_ne(self):
     a = Point(x=3, y=-7, a=5, b=7)
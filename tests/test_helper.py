@@ -26,6 +26,50 @@ class HelperTest(TestCase):
     got = encode_base58_checksum(b'\x6f' + bytes.fromhex(h160))
     self.assertEqual(got, addr)
 
+  def test_base58_checksum(self):
+    wif = 'L5oLkpV3aqBJ4BgssVAsax1iRa77G5CVYnv9adQ6Z87te7TyUdSC'
+    payload = decode_base58_checksum(wif)
+    self.assertEqual(len(payload), 34)
+    self.assertEqual(encode_base58_checksum(payload), wif)
+    with self.assertRaises(ValueError):
+      decode_base58_checksum(wif[:-1] + 'D')
+
+  def test_base58_many(self):
+    payloads = [b'', b'\x00\x00', b'\x00' + bytes(range(20)), bytes(range(255, 177, -1))]
+    encoded = encode_base58_checksum_many(payloads)
+    self.assertEqual(encoded, [encode_base58_checksum(p) for p in payloads])
+    self.assertEqual(decode_base58_many(encoded), payloads)
+    self.assertEqual(encode_base58(b'\x00\x00\x01'), '112')
+    self.assertEqual(encode_base58(b''), '')
+    with self.assertRaises(ValueError):
+      decode_base58_many(['1BenRpVUFK65JFWcQSuHnJKzc4M8ZP8Eq0'])
+
+  def test_bech32(self):
+    testcases = (
+      ('BC1QW508D6QEJXTDG4Y5R3ZARVARY0C5XW7KV8F3T4', 'bc', 0, '751e76e8199196d454941c45d1b3a323f1433bd6'),
+      ('tb1qrp33g0q5c5txsp9arysrx4k6zdkfs4nce4xj0gdcccefvpysxf3q0sl5k7', 'tb', 0, '1863143c14c5166804bd19203356da136c985678cd4d27a1b8c6329604903262'),
+      ('bc1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vqzk5jj0', 'bc', 1, '79be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798'),
+    )
+    for address, hrp, version, program in testcases:
+      self.assertEqual(decode_bech32(address), (hrp, version, bytes.fromhex(program)))
+      self.assertEqual(encode_bech32(hrp, version, bytes.fromhex(program)), address.lower())
+    h160 = bytes.fromhex('751e76e8199196d454941c45d1b3a323f1433bd6')
+    self.assertEqual(h160_to_p2wpkh_address(h160), 'bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4')
+    s256 = bytes.fromhex('1863143c14c5166804bd19203356da136c985678cd4d27a1b8c6329604903262')
+    self.assertEqual(sha256_to_p2wsh_address(s256, testnet=True), testcases[1][0])
+    for bad in ('bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t5', 'BC1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4', 'bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3tb'):
+      with self.assertRaises(ValueError):
+        decode_bech32(bad)
+    with self.assertRaises(ValueError):
+      encode_bech32('bc', 0, bytes(21))
+
+  def test_bech32_many(self):
+    addresses = [encode_bech32('bc', version, bytes(range(version + 2))) for version in range(1, 17)]
+    addresses.append('bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t5')
+    decoded = decode_bech32_many(addresses)
+    self.assertEqual(decoded[:-1], [('bc', v, bytes(range(v + 2))) for v in range(1, 17)])
+    self.assertIsNone(decoded[-1])
+
   def test_p2pkh_address(self):
     h160 = bytes.fromhex('74d691da1574e6b3c192ecfb52cc8984ee7b6c56')
     want = '1BenRpVUFK65JFWcQSuHnJKzc4M8ZP8Eqa'
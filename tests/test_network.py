@@ -10,7 +10,8 @@ from src.network import (
 )
 
 from src.block import (
-  Block
+  Block,
+  check_pow_many
 )
 
 class NetworkEnvelopeTest(TestCase):
@@ -55,6 +56,8 @@ class HeadersMessageTest(TestCase):
     self.assertEqual(len(headers.blocks), 2)
     for b in headers.blocks:
       self.assertEqual(b.__class__, Block)
+    self.assertEqual(headers.raw, b''.join(b.serialize() for b in headers.blocks))
+    self.assertEqual(check_pow_many(headers.raw), [True, True])
 
 class SimpleNodeTest(TestCase):
   def test_handshake(self):
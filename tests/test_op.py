@@ -1,5 +1,7 @@
 from unittest import TestCase
-from src.op import op_hash160, op_checksig, decode_num, op_checkmultisig
+from src import op
+from src.op import op_hash160, op_checksig, decode_num, op_checkmultisig, SIG_CACHE, SignatureCache
+from src.secp256k1 import PrivateKey, S256Point, Signature, N
 
 class OpTest(TestCase):
   def test_op_hash160(self):
@@ -16,6 +18,13 @@ class OpTest(TestCase):
     stack = [sig, sec]
     self.assertTrue(op_checksig(stack, z))
     self.assertEqual(decode_num(stack[0]), 1)
+    SIG_CACHE.clear()
+    deferred = []
+    stack = [sig, sec]
+    self.assertTrue(op_checksig(stack, z, deferred))
+    self.assertEqual(decode_num(stack[0]), 1)
+    self.assertEqual(len(deferred), 1)
+    self.assertTrue(deferred[0][0].verify(z, deferred[0][2]))
 
   def test_op_checkmultisig(self):
     z = 0xe71bfa115715d6fd33796948126f40a8cdd39f187e4afb03896795189fe1423c
@@ -25,4 +34,67 @@ class OpTest(TestCase):
     sec2 = bytes.fromhex('03b287eaf122eea69030a0e9feed096bed8045c8b98bec453e1ffac7fbdbd4bb71')
     stack = [b'', sig1, sig2, b'\x02', sec1, sec2, b'\x02']
     self.assertTrue(op_checkmultisig(stack, z))
-    self.assertEqual(decode_num(stack[0]), 1)
\ No newline at end of file
+    self.assertEqual(decode_num(stack[0]), 1)
+
+  def test_op_checkmultisig_modes(self):
+    z = 0xe71bfa115715d6fd33796948126f40a8cdd39f187e4afb03896795189fe1423c
+    keys = [PrivateKey(secret) for secret in (1111, 2222, 3333)]
+    secs = [key.point.sec() for key in keys]
+    sig1 = keys[0].sign(z).der() + b'\x01'
+    sig2 = keys[1].sign(z).der() + b'\x01'
+    try:
+      for recovery in (True, False):
+        op.MULTISIG_RECOVERY = recovery
+        SIG_CACHE.clear()
+        stack = [b'', sig1, sig2, b'\x02', secs[0], secs[1], secs[2], b'\x03']
+        self.assertTrue(op_checkmultisig(stack, z))
+        self.assertEqual(decode_num(stack[0]), 1)
+        self.assertEqual(SIG_CACHE.stats()['size'], 2)
+        SIG_CACHE.clear()
+        stack = [b'', sig2, sig1, b'\x02', secs[0], secs[1], secs[2], b'\x03']
+        self.assertFalse(op_checkmultisig(stack, z))
+    finally:
+      op.MULTISIG_RECOVERY = True
+    # a key that only recovers from R.x == r + N does not verify,
+    # so neither mode may accept it
+    x = N + 1
+    while True:
+      try:
+        S256Point.lift_x(x)
+        break
+      except ValueError:
+        x += 1
+    sig = Signature(x - N, 12345)
+    point = S256Point.recover(z, sig, 2)
+    self.assertFalse(point.verify(z, sig))
+    try:
+      for recovery in (True, False):
+        op.MULTISIG_RECOVERY = recovery
+        SIG_CACHE.clear()
+        stack = [b'', sig1, sig.der() + b'\x01', b'\x02', secs[0], point.sec(), b'\x02']
+        self.assertFalse(op_checkmultisig(stack, z))
+        self.assertEqual(SIG_CACHE.stats()['size'], 0)
+    finally:
+      op.MULTISIG_RECOVERY = True
+
+  def test_sig_cache(self):
+    z = 0x7c076ff316692a3d7eb3c3bb0f8b1488cf72e1afcd929e29307032997a838a3d
+    sec = bytes.fromhex('04887387e452b8eacc4acfde10d9aaf7f6d9a0f975aabb10d006e4da568744d06c61de6d95231cd89026e286df3b6ae4a894a3378e393e93a0f45b666329a0ae34')
+    sig = bytes.fromhex('3045022000eff69ef2b1bd93a66ed5219add4fb51e11a840f404876325a1e8ffe0529a2c022100c7207fee197d27c618aea621406f6bf5ef6fca38681d82b2f06fddbdce6feab601')
+    SIG_CACHE.clear()
+    for _ in range(2):
+      stack = [sig, sec]
+      self.assertTrue(op_checksig(stack, z))
+      self.assertEqual(decode_num(stack[0]), 1)
+    self.assertEqual(SIG_CACHE.stats()['hits'], 1)
+    self.assertEqual(SIG_CACHE.stats()['size'], 1)
+    stack = [sig, sec]
+    self.assertTrue(op_checksig(stack, z + 1))
+    self.assertEqual(decode_num(stack[0]), 0)
+    self.assertEqual(SIG_CACHE.stats()['size'], 1)
+    cache = SignatureCache(capacity=2)
+    for i in range(3):
+      cache.add(cache.key(i, b'', b''))
+    self.assertEqual(len(cache), 2)
+    self.assertFalse(cache.contains(cache.key(0, b'', b'')))
+    self.assertTrue(cache.contains(cache.key(2, b'', b'')))
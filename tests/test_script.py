@@ -1,4 +1,4 @@
-from src.script import Script
+from src.script import Script, p2wpkh_script, p2wsh_script
 
 from io import BytesIO
 from unittest import TestCase
@@ -16,4 +16,28 @@ class ScriptTest(TestCase):
     want = '6a47304402207899531a52d59a6de200179928ca900254a36b8dff8bb75f5f5d71b1cdc26125022008b422690b8461cb52c3cc30330b23d574351872b7c361e9aae3649071c1a7160121035d5c93d9ac96881f19ba1f686f15f009ded7c62efe85a872e6a19b43c15a2937'
     script_pubkey = BytesIO(bytes.fromhex(want))
     script = Script.parse(script_pubkey)
-    self.assertEqual(script.serialize().hex(), want)
\ No newline at end of file
+    self.assertEqual(script.serialize().hex(), want)
+
+  def test_segwit_script_pubkeys(self):
+    script_pubkey = p2wpkh_script(bytes(20))
+    self.assertEqual(script_pubkey.serialize().hex(), '160014' + '00' * 20)
+    self.assertTrue(script_pubkey.is_p2wpkh_script_pubkey())
+    self.assertFalse(script_pubkey.is_p2wsh_script_pubkey())
+    script_pubkey = Script.parse(BytesIO(p2wsh_script(bytes(32)).serialize()))
+    self.assertTrue(script_pubkey.is_p2wsh_script_pubkey())
+    self.assertFalse(script_pubkey.is_p2sh_script_pubkey())
+
+  def test_parse_view(self):
+    raw = bytes.fromhex('1976a914bc3b654dca7e56b04dca18f2566cdaf02e8d9ada88ac')
+    script, offset = Script.parse_view(memoryview(b'\xff' + raw), 1)
+    self.assertEqual(offset, len(raw) + 1)
+    self.assertEqual(script.serialize(), raw)
+    self.assertEqual(script.cmds, Script.parse(BytesIO(raw)).cmds)
+    self.assertTrue(script.is_p2pkh_script_pubkey())
+    script.cmds[2] = bytes(20)
+    self.assertEqual(script.serialize().hex(), '1976a914' + '00' * 20 + '88ac')
+    with self.assertRaises(SyntaxError):
+      Script.parse_view(memoryview(raw[:-1]))
+    script, _ = Script.parse_view(memoryview(bytes.fromhex('024c05')))
+    with self.assertRaises(SyntaxError):
+      script.cmds
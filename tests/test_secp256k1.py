@@ -1,8 +1,40 @@
-from src.secp256k1 import S256Point, Signature, PrivateKey, N, G
+from src.ecc import Point
+from src.secp256k1 import (
+  S256Point,
+  Signature,
+  SchnorrSignature,
+  PrivateKey,
+  N,
+  G,
+  PointTableCache,
+  POINT_TABLES,
+  SecCache,
+  SEC_CACHE,
+  derive_addresses,
+  GeneratorTable,
+  INFINITY,
+  LAMBDA,
+  from_jacobian,
+  glv_split,
+  jacobian_add,
+  jacobian_double,
+  jacobian_multiply,
+  to_jacobian,
+  verify_batch,
+  verify_schnorr_batch,
+  wnaf,
+)
 
 from unittest import TestCase
 from random import randint
 
+import copy
+import json
+import os
+import pickle
+import random
+import tempfile
+
 class S256Test(TestCase):
   def test_order(self):
     point = N * G
@@ -25,6 +57,85 @@ class S256Test(TestCase):
       # check that the secret*G is the same as the point
       self.assertEqual(secret * G, point)
 
+  def test_jacobian(self):
+    # the Jacobian engine must agree with the affine Point arithmetic
+    for coefficient in (1, 2, 3, 7, 1485, 2**128 + 1, N - 1):
+      self.assertEqual(coefficient * G, Point.__rmul__(G, coefficient))
+    p = to_jacobian(G)
+    self.assertEqual(from_jacobian(jacobian_double(p)), G + G)
+    self.assertEqual(from_jacobian(jacobian_add(jacobian_double(p), p)), G + G + G)
+    self.assertEqual(from_jacobian(jacobian_add(p, INFINITY)), G)
+    self.assertIsNone(from_jacobian(jacobian_add(p, to_jacobian(-1 * G))).x)
+
+  def test_trusted(self):
+    point = 1485 * G
+    self.assertFalse(hasattr(point, '__dict__'))
+    self.assertFalse(hasattr(point.x, '__dict__'))
+    self.assertEqual(S256Point.trusted(point.x.num, point.y.num), S256Point(point.x.num, point.y.num))
+    with self.assertRaises(ValueError):
+      S256Point(point.x.num, point.y.num + 1)
+
+  def test_generator_table(self):
+    for coefficient in (0, 1, 15, 16, 255, 256, 2**255 + 12345, N - 1, randint(0, N)):
+      want = from_jacobian(jacobian_multiply(to_jacobian(G), coefficient))
+      self.assertEqual(from_jacobian(GeneratorTable.multiply(coefficient)), want)
+    with tempfile.TemporaryDirectory() as tmp:
+      filename = os.path.join(tmp, 'g.table')
+      GeneratorTable.dump_cache(filename)
+      table = GeneratorTable.table
+      GeneratorTable.table = None
+      GeneratorTable.load_cache(filename)
+      self.assertEqual(GeneratorTable.table, table)
+      with open(filename) as f:
+        disk_cache = json.load(f)
+      rows = disk_cache['rows']
+      bad_tables = (
+        rows[:16],
+        rows[:1] + rows[2:] + rows[1:2],
+        rows[:3] + [rows[3][:-1]] + rows[4:],
+        rows[:3] + [rows[3][:5] + rows[3][6:7] + rows[3][5:6] + rows[3][7:]] + rows[4:],
+      )
+      for bad_rows in bad_tables:
+        with open(filename, 'w') as f:
+          json.dump({'window': disk_cache['window'], 'rows': bad_rows}, f)
+        with self.assertRaises(ValueError):
+          GeneratorTable.load_cache(filename)
+        self.assertEqual(GeneratorTable.table, table)
+
+  def test_wnaf(self):
+    for coefficient in (1, 7, 0xdeadbeef, N - 1):
+      digits = wnaf(coefficient, 5)
+      self.assertEqual(sum(d * 2**i for i, d in enumerate(digits)), coefficient)
+      for digit in digits:
+        self.assertTrue(digit == 0 or (digit % 2 == 1 and abs(digit) < 16))
+
+  def test_multi_mul(self):
+    p1 = 1485 * G
+    p2 = (2**128) * G
+    pairs = [(randint(0, N), G), (randint(0, N), p1), (randint(0, N), p2), (0, p1)]
+    want = S256Point(None, None)
+    for scalar, point in pairs:
+      want += Point.__rmul__(point, scalar)
+    self.assertEqual(S256Point.multi_mul(pairs), want)
+    self.assertEqual(S256Point.multi_mul([(5, p1), (N - 5, p1)]), S256Point(None, None))
+    self.assertEqual(S256Point.multi_mul([]), S256Point(None, None))
+
+  def test_glv(self):
+    for coefficient in (1, N - 1, 2**255 + 19, randint(0, N)):
+      k1, k2 = glv_split(coefficient)
+      self.assertEqual((k1 + k2 * LAMBDA) % N, coefficient)
+      self.assertLess(abs(k1), 2**129)
+      self.assertLess(abs(k2), 2**129)
+    point = 1485 * G
+    coefficient = randint(0, N)
+    try:
+      S256Point.use_glv = False
+      want = coefficient * point
+      S256Point.use_glv = True
+      self.assertEqual(coefficient * point, want)
+    finally:
+      S256Point.use_glv = True
+
   def test_verify(self):
     point = S256Point(
       0x887387e452b8eacc4acfde10d9aaf7f6d9a0f975aabb10d006e4da568744d06c,
@@ -39,6 +150,114 @@ class S256Test(TestCase):
     s = 0xc7207fee197d27c618aea621406f6bf5ef6fca38681d82b2f06fddbdce6feab6
     self.assertTrue(point.verify(z, Signature(r, s)))
 
+  def test_normalize_batch(self):
+    points = [jacobian_double(to_jacobian(G)), INFINITY, jacobian_multiply(to_jacobian(G), 999)]
+    want = [G + G, S256Point(None, None), 999 * G]
+    self.assertEqual(S256Point.normalize_batch(points), want)
+
+  def test_verify_batch(self):
+    items = []
+    for secret in (1, 2**64 + 3, randint(1, N)):
+      pk = PrivateKey(secret)
+      z = randint(0, 2**256)
+      items.append((pk.point, z, pk.sign(z)))
+    self.assertEqual(verify_batch(items), [True, True, True])
+    point, z, sig = items[1]
+    items[1] = (point, z + 1, sig)
+    items.append((point, z, Signature(sig.r, 0)))
+    self.assertEqual(verify_batch(items), [True, False, True, False])
+    self.assertEqual(verify_batch([]), [])
+
+  def test_verify_schnorr(self):
+    point = S256Point.parse_xonly(bytes.fromhex('d69c3509bb99e412e68b0fe8544e72837dfa30746d8be2aa65975f29d22dc7b9'))
+    msg = bytes.fromhex('4df3c3f68fcc83b27e9d42c90431a72499f17875c81a599b566c9889b9696703')
+    sig = SchnorrSignature.parse(bytes.fromhex('00000000000000000000003b78ce563f89a0ed9414f5aa28ad0d96d6795f9c6376afb1548af603b3eb45c9f8207dee1060cb71c04e80f593060b07d28308d7f4'))
+    self.assertTrue(point.verify_schnorr(msg, sig))
+    self.assertFalse(point.verify_schnorr(msg[::-1], sig))
+    self.assertFalse(point.verify_schnorr(msg, SchnorrSignature(sig.r, sig.s + N)))
+    self.assertFalse(point.verify_schnorr(msg, SchnorrSignature(sig.r, N - sig.s)))
+    self.assertEqual(point.xonly(), bytes.fromhex('d69c3509bb99e412e68b0fe8544e72837dfa30746d8be2aa65975f29d22dc7b9'))
+    self.assertEqual(point.y.num % 2, 0)
+    with self.assertRaises(ValueError):
+      S256Point.lift_x(5)
+
+  def test_verify_schnorr_batch(self):
+    items = []
+    for secret in (1, 2**64 + 3, randint(1, N)):
+      pk = PrivateKey(secret)
+      msg = randint(0, 2**256).to_bytes(32, 'big')
+      items.append((pk.point, msg, pk.sign_schnorr(msg)))
+    self.assertEqual(verify_schnorr_batch(items), [True, True, True])
+    point, msg, sig = items[1]
+    items[1] = (point, msg[::-1], sig)
+    items.append((point, msg, SchnorrSignature(sig.r, N)))
+    self.assertEqual(verify_schnorr_batch(items), [True, False, True, False])
+    self.assertEqual(verify_schnorr_batch([]), [])
+    # shifting s by weight-scaled amounts only cancels out if the
+    # weights can be predicted, as they could with a seeded Mersenne Twister
+    random.seed(1)
+    weight = random.randint(1, N - 1)
+    sig0, sig1 = pk.sign_schnorr(msg), pk.sign_schnorr(msg[::-1])
+    forged = [
+      (pk.point, msg, SchnorrSignature(sig0.r, (sig0.s + weight) % N)),
+      (pk.point, msg[::-1], SchnorrSignature(sig1.r, (sig1.s - 1) % N)),
+    ]
+    random.seed(1)
+    self.assertEqual(verify_schnorr_batch(forged), [False, False])
+
+  def test_point_tables(self):
+    cache = PointTableCache(threshold=2, capacity=1, width=6)
+    point = 1485 * G
+    self.assertIsNone(cache.get(point))
+    table = cache.get(point)
+    self.assertEqual(table[0], 6)
+    self.assertIs(cache.get(point), table)
+    self.assertEqual(cache.stats()['tables'], 1)
+    self.assertEqual(cache.stats()['hits'], 1)
+    self.assertGreater(cache.stats()['memory'], 0)
+    other = 2 * point
+    cache.get(other)
+    cache.get(other)
+    self.assertEqual(len(cache), 1)
+    cache.resize(0)
+    self.assertEqual(cache.stats()['memory'], 0)
+
+  def test_verify_hot(self):
+    pk = PrivateKey(randint(1, N))
+    POINT_TABLES.clear()
+    for _ in range(POINT_TABLES.threshold + 2):
+      z = randint(0, 2**256)
+      sig = pk.sign(z)
+      self.assertTrue(pk.point.verify(z, sig))
+      self.assertFalse(pk.point.verify(z + 1, sig))
+    self.assertEqual(POINT_TABLES.stats()['tables'], 1)
+
+  def test_recover(self):
+    pk = PrivateKey(randint(1, N))
+    z = randint(0, 2**256 - 1)
+    sig = pk.sign(z)
+    recovered = [S256Point.recover(z, sig, recid) for recid in (0, 1)]
+    self.assertIn(pk.point, recovered)
+    self.assertIn(pk.point, S256Point.recover_candidates(z, sig))
+    with self.assertRaises(ValueError):
+      S256Point.recover(z, Signature(0, sig.s), 0)
+
+  def test_compact(self):
+    pk = PrivateKey(12345)
+    z = 0xec208baa0fc1c19f708a9ca96fdeff3ac3f230bb4a7ba4aede4942ad003c0f60
+    compact = pk.sign_compact(z, compressed=True)
+    self.assertEqual(len(compact), 65)
+    sig, recid, compressed = Signature.parse_compact(compact)
+    self.assertTrue(compressed)
+    self.assertEqual(S256Point.recover(z, sig, recid), pk.point)
+    self.assertTrue(pk.point.verify_compact(z, compact))
+    self.assertFalse(pk.point.verify_compact(z + 1, compact))
+    self.assertFalse(PrivateKey(54321).point.verify_compact(z, compact))
+    self.assertFalse(pk.point.verify_compact(z, bytes([40]) + compact[1:]))
+    self.assertFalse(pk.point.verify_compact(z, compact[:-1]))
+    with self.assertRaises(SyntaxError):
+      Signature.parse_compact(compact[1:])
+
   def test_sec(self):
     coefficient = 999**3
     uncompressed = '049d5ca49670cbe4c3bfa84c96a8c87df086c6ea6a24ba6b809c9de234496808d56fa15cc7f3d38cda98dee2419f415b7513dde1301f8643cd9245aea7f3f911f9'
@@ -59,6 +278,28 @@ class S256Test(TestCase):
     self.assertEqual(point.sec(compressed=False), bytes.fromhex(uncompressed))
     self.assertEqual(point.sec(compressed=True), bytes.fromhex(compressed))
 
+  def test_parse(self):
+    for coefficient in (999**3, 123, 42424242):
+      point = coefficient * G
+      for compressed in (True, False):
+        self.assertEqual(S256Point.parse(point.sec(compressed)), point)
+
+  def test_sec_cache(self):
+    sec = (999**3 * G).sec()
+    SEC_CACHE.clear()
+    first = S256Point.parse(sec)
+    self.assertIs(S256Point.parse(sec), first)
+    self.assertEqual(SEC_CACHE.stats()['hits'], 1)
+    self.assertEqual(SEC_CACHE.stats()['misses'], 1)
+    cache = SecCache(capacity=2)
+    for key in (b'a', b'b', b'c'):
+      cache.put(key, first)
+    self.assertIsNone(cache.get(b'a'))
+    self.assertIs(cache.get(b'c'), first)
+    cache.resize(1)
+    self.assertEqual(len(cache), 1)
+    self.assertIsNone(cache.get(b'b'))
+
   def test_address(self):
     secret = 888**3
     mainnet_address = '148dY81A9BmdpMhvYEVznrM45kWN32vSCN'
@@ -79,12 +320,65 @@ class S256Test(TestCase):
     self.assertEqual(point.address(compressed=False, testnet=False), mainnet_address)
     self.assertEqual(point.address(compressed=False, testnet=True), testnet_address)
 
+  def test_derive_addresses(self):
+    secrets = list(range(2**200, 2**200 + 5)) + [321, 888**3, N - 1, 1, 2]
+    got = list(derive_addresses(iter(secrets), compressed=False, testnet=True, chunk_size=4))
+    want = [PrivateKey(s).point.address(compressed=False, testnet=True) for s in secrets]
+    self.assertEqual(got, want)
+    self.assertEqual(next(derive_addresses([888**3])), '148dY81A9BmdpMhvYEVznrM45kWN32vSCN')
+    with self.assertRaises(ValueError):
+      list(derive_addresses([N]))
+
 class PrivateKeyTest(TestCase):
   def test_sign(self):
     pk = PrivateKey(randint(0, N))
     z = randint(0, 2**256)
     sig = pk.sign(z)
     self.assertTrue(pk.point.verify(z, sig))
+    for copied in (pickle.loads(pickle.dumps(pk)), copy.deepcopy(pk)):
+      self.assertEqual(copied.secret, pk.secret)
+      self.assertEqual(copied.sign(z).der(), sig.der())
+
+  def test_sign_schnorr(self):
+    # BIP340 test vectors 0-3
+    testcases = (
+      (3, '00' * 32, '00' * 32,
+       'e907831f80848d1069a5371b402410364bdf1c5f8307b0084c55f1ce2dca821525f66a4a85ea8b71e482a74f382d2ce5ebeee8fdb2172f477df4900d310536c0'),
+      (0xb7e151628aed2a6abf7158809cf4f3c762e7160f38b4da56a784d9045190cfef, '00' * 31 + '01',
+       '243f6a8885a308d313198a2e03707344a4093822299f31d0082efa98ec4e6c89',
+       '6896bd60eeae296db48a229ff71dfe071bde413e6d43f917dc8dcf8c78de33418906d11ac976abccb20b091292bff4ea897efcb639ea871cfa95f6de339e4b0a'),
+      (0xc90fdaa22168c234c4c6628b80dc1cd129024e088a67cc74020bbea63b14e5c9,
+       'c87aa53824b4d7ae2eb035a2b5bbbccc080e76cdc6d1692c4b0b62d798e6d906',
+       '7e2d58d8b3bcdf1abadec7829054f90dda9805aab56c77333024b9d0a508b75c',
+       '5831aaeed7b44bb74e5eab94ba9d4294c49bcf2a60728d8b4c200f50dd313c1bab745879a5ad954a72c45a91c3a51d3c7adea98d82f8481e0e1e03674a6f3fb7'),
+      (0x0b432b2677937381aef05bb02a66ecd012773062cf3fa2549e44f58ed2401710, 'ff' * 32, 'ff' * 32,
+       '7eb0509757e246f19449885651611cb965ecc1a187dd51b64fda1edc9637d5ec97582b9cb13db3933705b32ba982af5af25fd78881ebb32771fc5922efc66ea3'),
+    )
+    for secret, aux, msg, want in testcases:
+      pk = PrivateKey(secret)
+      msg = bytes.fromhex(msg)
+      sig = pk.sign_schnorr(msg, bytes.fromhex(aux))
+      self.assertEqual(sig.serialize().hex(), want)
+      self.assertTrue(pk.point.verify_schnorr(msg, sig))
+      self.assertTrue(S256Point.parse_xonly(pk.point.xonly()).verify_schnorr(msg, sig))
+    pk = PrivateKey(randint(1, N))
+    sig = pk.sign_schnorr(b'')
+    self.assertTrue(pk.point.verify_schnorr(b'', sig))
+
+  def test_sign_many(self):
+    pk = PrivateKey(randint(1, N))
+    zs = [randint(0, 2**256) for _ in range(6)]
+    sigs = pk.sign_many(zs)
+    for z, sig in zip(zs, sigs):
+      k = pk.deterministic_k(z)
+      r = (k * G).x.num
+      s = (z + r * pk.secret) * pow(k, N - 2, N) % N
+      if s > N/s:
+        s = N - s
+      self.assertEqual((sig.r, sig.s), (r, s))
+      self.assertTrue(pk.point.verify(z, sig))
+    pooled = pk.sign_many(zs, workers=2, chunk_size=2)
+    self.assertEqual([(s.r, s.s) for s in pooled], [(s.r, s.s) for s in sigs])
 
   def test_wif(self):
     pk = PrivateKey(2**256 - 2**199)
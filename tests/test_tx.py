@@ -1,7 +1,12 @@
 from io import BytesIO
 from unittest import TestCase
 
-from src.tx import Tx, TxFetcher
+import hashlib
+import pickle
+
+from src.helper import hash160, hash256
+from src.script import Script, p2pkh_script, p2sh_script, p2wpkh_script, p2wsh_script, parse_cmds
+from src.tx import Tx, TxFetcher, TxIn, TxOut, verify_many
 from src.secp256k1 import PrivateKey
 
 class TxTest(TestCase):
@@ -50,6 +55,67 @@ class TxTest(TestCase):
     tx = Tx.parse(stream)
     self.assertEqual(tx.locktime, 410393)
 
+  def test_parse_bytes(self):
+    raw_tx = bytes.fromhex('0100000001813f79011acb80925dfe69b3def355fe914bd1d96a3f5f71bf8303c6a989c7d1000000006b483045022100ed81ff192e75a3fd2304004dcadb746fa5e24c5031ccfcf21320b0277457c98f02207a986d955c6e0cb35d446a89d3f56100f4d7f67801c31967743a9c8e10615bed01210349fc4e631e3624a545de3f89f5d8684c7b8138bd94bdd531d2e213bf016b278afeffffff02a135ef01000000001976a914bc3b654dca7e56b04dca18f2566cdaf02e8d9ada88ac99c39800000000001976a9141c4bc762dd5423e332166702cb75f40df79fea1288ac19430600')
+    want = Tx.parse(BytesIO(raw_tx))
+    tx = Tx.parse_bytes(raw_tx)
+    self.assertEqual(tx.serialize(), raw_tx)
+    self.assertEqual(tx.id(), want.id())
+    self.assertEqual(tx.locktime, 410393)
+    self.assertEqual(tx.tx_ins[0].prev_tx, want.tx_ins[0].prev_tx)
+    self.assertEqual(tx.tx_ins[0].sequence, 0xfffffffe)
+    self.assertNotIn('cmds', tx.tx_outs[1].script_pubkey.__dict__)
+    self.assertEqual(tx.tx_outs[1].script_pubkey.cmds, want.tx_outs[1].script_pubkey.cmds)
+    self.assertEqual(tx.tx_ins[0].script_sig.cmds, want.tx_ins[0].script_sig.cmds)
+    txs = Tx.parse_many(raw_tx * 3)
+    self.assertEqual([t.id() for t in txs], [want.id()] * 3)
+    with self.assertRaises(SyntaxError):
+      Tx.parse_bytes(raw_tx[:-1])
+    with self.assertRaises(SyntaxError):
+      Tx.parse_bytes(raw_tx + b'\x00')
+
+  def test_memoized_serialization(self):
+    raw_tx = bytes.fromhex('0100000001813f79011acb80925dfe69b3def355fe914bd1d96a3f5f71bf8303c6a989c7d1000000006b483045022100ed81ff192e75a3fd2304004dcadb746fa5e24c5031ccfcf21320b0277457c98f02207a986d955c6e0cb35d446a89d3f56100f4d7f67801c31967743a9c8e10615bed01210349fc4e631e3624a545de3f89f5d8684c7b8138bd94bdd531d2e213bf016b278afeffffff02a135ef01000000001976a914bc3b654dca7e56b04dca18f2566cdaf02e8d9ada88ac99c39800000000001976a9141c4bc762dd5423e332166702cb75f40df79fea1288ac19430600')
+    for tx in (Tx.parse(BytesIO(raw_tx)), Tx.parse_bytes(raw_tx)):
+      self.assertEqual(tx.id(), '452c629d67e41baec3ac6f04fe744b4b9617f8f859c63b3002f8684e7a4fee03')
+      self.assertIs(tx.hash(), tx.hash())
+      tx.locktime = 0
+      self.assertEqual(tx.serialize(), raw_tx[:-4] + bytes(4))
+      tx.tx_ins[0].script_sig = Script([b'\x01'])
+      self.assertEqual(tx.serialize(), raw_tx[:41] + bytes.fromhex('020101') + raw_tx[149:-4] + bytes(4))
+      tx.tx_outs[1].amount = 0
+      self.assertEqual(tx.tx_outs[1].serialize()[:8], bytes(8))
+      self.assertEqual(tx.serialize()[-38:-30], bytes(8))
+      tx.tx_outs.pop()
+      self.assertEqual(tx.serialize(), Tx.parse(BytesIO(tx.serialize())).serialize())
+      self.assertEqual(len(Tx.parse(BytesIO(tx.serialize())).tx_outs), 1)
+      tx.tx_outs[0] = TxOut(1, Script())
+      self.assertEqual(tx.serialize()[-14:], bytes.fromhex('0101000000000000000000000000'))
+    copied = pickle.loads(pickle.dumps(Tx.parse_bytes(raw_tx)))
+    self.assertEqual(copied.serialize(), raw_tx)
+
+  def test_parse_segwit(self):
+    raw_tx = bytes.fromhex('0100000000010115e180dc28a2327e687facc33f10f2a20da717e5548406f7ae8b4c811072f8560200000000ffffffff0188b3f505000000001976a9141d7cd6c75c2e86f4cbf98eaed221b30bd9a0b92888ac02483045022100f9d3fe35f5ec8ceb07d3db95adcedac446f3b19a8f3174e7e8f904b1594d5b43022074d995d89a278bd874d45d0aea835d3936140397392698b7b5bbcdef8d08f2fd012321038262a6c6cec93c2d3ecd6c6072efea86d02ff8e3328bbd0242b20af3425990acac00000000')
+    for tx in (Tx.parse(BytesIO(raw_tx)), Tx.parse_bytes(raw_tx)):
+      self.assertTrue(tx.segwit)
+      self.assertEqual(tx.id(), '78457666f82c28aa37b74b506745a7c7684dc7842a52a457b09f09446721e11c')
+      self.assertEqual(tx.serialize(), raw_tx)
+      self.assertEqual(tx.serialize_legacy(), raw_tx[:4] + raw_tx[6:83] + raw_tx[-4:])
+      self.assertEqual(tx.wtxid(), hash256(raw_tx)[::-1].hex())
+      self.assertEqual(len(tx.tx_ins[0].witness), 2)
+      self.assertEqual(tx.tx_ins[0].witness[1].hex(), '21038262a6c6cec93c2d3ecd6c6072efea86d02ff8e3328bbd0242b20af3425990acac')
+      self.assertEqual(tx.locktime, 0)
+      self.assertEqual(tx.weight(), 3 * 85 + 197)
+      self.assertEqual(tx.vsize(), 113)
+      tx.tx_ins[0].witness = []
+      self.assertEqual(len(tx.serialize()), 197 - 109)
+    legacy = Tx.parse_bytes(raw_tx[:4] + raw_tx[6:83] + raw_tx[-4:])
+    self.assertFalse(legacy.segwit)
+    self.assertEqual(legacy.wtxid(), legacy.id())
+    self.assertEqual(legacy.weight(), 4 * 85)
+    with self.assertRaises(SyntaxError):
+      Tx.parse_bytes(raw_tx[:5] + b'\x02' + raw_tx[6:])
+
   def test_fee(self):
     raw_tx = bytes.fromhex('0100000001813f79011acb80925dfe69b3def355fe914bd1d96a3f5f71bf8303c6a989c7d1000000006b483045022100ed81ff192e75a3fd2304004dcadb746fa5e24c5031ccfcf21320b0277457c98f02207a986d955c6e0cb35d446a89d3f56100f4d7f67801c31967743a9c8e10615bed01210349fc4e631e3624a545de3f89f5d8684c7b8138bd94bdd531d2e213bf016b278afeffffff02a135ef01000000001976a914bc3b654dca7e56b04dca18f2566cdaf02e8d9ada88ac99c39800000000001976a9141c4bc762dd5423e332166702cb75f40df79fea1288ac19430600')
     stream = BytesIO(raw_tx)
@@ -65,6 +131,31 @@ class TxTest(TestCase):
     want = int('27e0c5994dec7824e56dec6b2fcb342eb7cdb0d0957c2fce9882f715e85d81a6', 16)
     self.assertEqual(tx.sig_hash(0), want)
 
+  def test_sig_hash_context(self):
+    tx = TxFetcher.fetch('452c629d67e41baec3ac6f04fe744b4b9617f8f859c63b3002f8684e7a4fee03')
+    self.assertEqual(tx.sig_hash(0), tx.sig_hash_reference(0))
+    prev_tx = Tx(1, [], [TxOut(1000, p2pkh_script(bytes(20))), TxOut(2000, p2pkh_script(bytes(range(20))))], 0)
+    prev = prev_tx.id()
+    TxFetcher.cache[prev] = prev_tx
+    try:
+      tx_ins = [TxIn(bytes.fromhex(prev), i % 2, sequence=i) for i in range(5)]
+      tx = Tx(1, tx_ins, [TxOut(500, p2pkh_script(bytes(20)))], 7)
+      for i in range(5):
+        self.assertEqual(tx.sig_hash(i), tx.sig_hash_reference(i))
+      redeem_script = Script([0x51])
+      self.assertEqual(tx.sig_hash(4, redeem_script), tx.sig_hash_reference(4, redeem_script))
+      midstates = tx.legacy_sighash_context()[0]
+      self.assertIs(tx.legacy_sighash_context()[0], midstates)
+      tx_ins[2].sequence = 0
+      tx.tx_outs.append(TxOut(1, Script()))
+      tx.locktime = 8
+      for i in range(5):
+        self.assertEqual(tx.sig_hash(i), tx.sig_hash_reference(i))
+      self.assertFalse(tx.sign_input(3, PrivateKey(11)))
+      self.assertEqual(tx.sig_hash(3), tx.sig_hash_reference(3))
+    finally:
+      del TxFetcher.cache[prev]
+
   def test_verify_p2pkh(self):
     tx = TxFetcher.fetch('452c629d67e41baec3ac6f04fe744b4b9617f8f859c63b3002f8684e7a4fee03')
     self.assertTrue(tx.verify())
@@ -75,6 +166,18 @@ class TxTest(TestCase):
     tx = TxFetcher.fetch('46df1a9484d0a81d03ce0ee543ab6e1a23ed06175c104a178268fad381216c2b')
     self.assertTrue(tx.verify())
 
+  def test_verify_batch(self):
+    tx1 = TxFetcher.fetch('452c629d67e41baec3ac6f04fe744b4b9617f8f859c63b3002f8684e7a4fee03')
+    tx2 = TxFetcher.fetch('46df1a9484d0a81d03ce0ee543ab6e1a23ed06175c104a178268fad381216c2b')
+    self.assertTrue(tx1.verify(batch=True))
+    self.assertTrue(verify_many([tx1, tx2]))
+
+  def test_verify_workers(self):
+    tx1 = TxFetcher.fetch('452c629d67e41baec3ac6f04fe744b4b9617f8f859c63b3002f8684e7a4fee03')
+    tx2 = TxFetcher.fetch('46df1a9484d0a81d03ce0ee543ab6e1a23ed06175c104a178268fad381216c2b')
+    self.assertTrue(tx1.verify(workers=2))
+    self.assertTrue(verify_many([tx1, tx2], workers=2, chunk_size=1))
+
   def test_sign_input(self):
     private_key = PrivateKey(secret=60769130824319408353938620389252947401257764673552228227111641623711956330709)
     stream = BytesIO(bytes.fromhex('01000000015dfd5bb40151e3398279e891bc5b6d58eca66438b47ede56a9e070d1dacb8dc8000000006c493046022100953952e9c985b3c41a3f03dedc27f9bde9d1535d239079edf3324fd5f5699508022100b0e0c9c557e5db1b6365880e42fb61b1cbe95543b03355418ae0bd54454db755012102226b91dd3420c54a0443b8bf151949235ac70678f7bd4ea27d76d93d44262e7dffffffff0280290b00000000001976a914171799463a09d271d928edb2b8ecdea8cf1f6d8788ac40420f00000000001976a91441da132d103a6d21382361d6487ae217f042c23588ac00000000'))
@@ -83,6 +186,89 @@ class TxTest(TestCase):
     want = '01000000015dfd5bb40151e3398279e891bc5b6d58eca66438b47ede56a9e070d1dacb8dc8000000006c493046022100953952e9c985b3c41a3f03dedc27f9bde9d1535d239079edf3324fd5f5699508022100b0e0c9c557e5db1b6365880e42fb61b1cbe95543b03355418ae0bd54454db755012102226b91dd3420c54a0443b8bf151949235ac70678f7bd4ea27d76d93d44262e7dffffffff0280290b00000000001976a914171799463a09d271d928edb2b8ecdea8cf1f6d8788ac40420f00000000001976a91441da132d103a6d21382361d6487ae217f042c23588ac00000000'
     self.assertEqual(tx_obj.serialize().hex(), want)
 
+  def test_sig_hash_bip143(self):
+    # native p2wpkh example from BIP143
+    raw_tx = bytes.fromhex('0100000002fff7f7881a8099afa6940d42d1e7f6362bec38171ea3edf433541db4e4ad969f0000000000eeffffffef51e1b804cc89d182d279655c3aa89e815b1b309fe287d9b2b55d57b90ec68a0100000000ffffffff02202cb206000000001976a9148280b37df378db99f66f85c95a783a76ac7a6d5988ac9093510d000000001976a9143bde42dbee7e4dbe6a21b2d50ce2f0167faa815988ac11000000')
+    tx = Tx.parse_bytes(raw_tx)
+    prev = tx.tx_ins[1].prev_tx.hex()
+    TxFetcher.cache[prev] = Tx(1, [], [TxOut(0, Script()), TxOut(600000000, p2wpkh_script(bytes.fromhex('1d0f172a0ecb48aee1be1f2687d2963ae33f71a1')))], 0)
+    try:
+      hashes = [h.hex() for h in tx.bip143_hashes()]
+      self.assertEqual(hashes, [
+        '96b827c8483d4e9b96712b6713a7b68d6e8003a781feba36c31143470b4efd37',
+        '52b0a642eea2fb7ae638c36f6252b6750293dbe574a806984b8e4d8548339a3b',
+        '863ef3e1a92afbfdb97f31ad0fc7683ee943e9abcf2501590ff8f6551f47e5e5',
+      ])
+      self.assertIs(tx.bip143_hashes(), tx.bip143_hashes())
+      want = 0xc37af31116d1b27caf68aae9e3ac82f1477929014d5b917657d0eb49478cb670
+      self.assertEqual(tx.sig_hash_bip143(1), want)
+      tx.tx_ins[1].witness = [
+        bytes.fromhex('304402203609e17b84f6a7d30c80bfa610b5b4542f32a8a0d5447a12fb1366d7f01cc44a0220573a954c4518331561406f90300e8f3358f51928d43c212a8caed02de67eebee01'),
+        bytes.fromhex('025476c2e83188368da1ff3e292e7acafcdb3566bb0ad253f62fc70f07aeee6357'),
+      ]
+      self.assertTrue(tx.verify_input(1))
+      tx.tx_ins[1].witness = []
+      self.assertFalse(tx.verify_input(1))
+      self.assertTrue(tx.sign_input(1, PrivateKey(0x619c335025c7f4012e556c2a58b2506e30b8511b53ade95ea316fd8c3286feb9)))
+      self.assertTrue(tx.segwit)
+      tx.tx_outs[0].amount -= 1
+      self.assertNotEqual(tx.bip143_hashes()[2].hex(), hashes[2])
+      self.assertFalse(tx.verify_input(1))
+    finally:
+      del TxFetcher.cache[prev]
+
+  def test_verify_p2wsh(self):
+    private_key = PrivateKey(8675309)
+    witness_script = Script([private_key.point.sec(), 0xac])
+    s256 = hashlib.sha256(witness_script.raw_serialize()).digest()
+    redeem_script = p2wpkh_script(private_key.point.hash160())
+    prev_tx = Tx(1, [], [
+      TxOut(50000, p2wsh_script(s256)),
+      TxOut(60000, p2sh_script(hash160(redeem_script.raw_serialize()))),
+    ], 0)
+    prev = prev_tx.id()
+    TxFetcher.cache[prev] = prev_tx
+    try:
+      tx_ins = [TxIn(bytes.fromhex(prev), 0), TxIn(bytes.fromhex(prev), 1)]
+      tx = Tx(1, tx_ins, [TxOut(100000, p2pkh_script(bytes(20)))], 0, segwit=True)
+      z = tx.sig_hash_bip143(0, witness_script=witness_script)
+      sig = private_key.sign(z).der() + b'\x01'
+      tx_ins[0].witness = [sig, witness_script.raw_serialize()]
+      self.assertTrue(tx.verify_input(0))
+      tx_ins[0].witness = [sig, Script([private_key.point.sec(), 0x87]).raw_serialize()]
+      self.assertFalse(tx.verify_input(0))
+      tx_ins[1].script_sig = Script([redeem_script.raw_serialize()])
+      z = tx.sig_hash_bip143(1, redeem_script=redeem_script)
+      sig = private_key.sign(z).der() + b'\x01'
+      tx_ins[1].witness = [sig, private_key.point.sec()]
+      self.assertTrue(tx.verify_input(1))
+      tx_ins[0].witness = [tx_ins[0].witness[0], witness_script.raw_serialize()]
+      self.assertTrue(tx.verify())
+      self.assertTrue(tx.verify(batch=True))
+      tx_ins[1].witness = [sig, PrivateKey(2).point.sec()]
+      self.assertFalse(tx.verify_input(1))
+    finally:
+      del TxFetcher.cache[prev]
+    # a non-minimal OP_PUSHDATA1 push of the key must be hashed as is
+    raw_witness_script = b'\x4c\x21' + private_key.point.sec() + b'\xac'
+    self.assertNotEqual(Script(parse_cmds(raw_witness_script)).raw_serialize(), raw_witness_script)
+    prev_tx = Tx(1, [], [TxOut(50000, p2wsh_script(hashlib.sha256(raw_witness_script).digest()))], 0)
+    prev = prev_tx.id()
+    TxFetcher.cache[prev] = prev_tx
+    try:
+      tx = Tx(1, [TxIn(bytes.fromhex(prev), 0)], [TxOut(40000, p2pkh_script(bytes(20)))], 0, segwit=True)
+      z = tx.sig_hash_bip143(0, witness_script=raw_witness_script)
+      sig = private_key.sign(z).der() + b'\x01'
+      tx.tx_ins[0].witness = [sig, raw_witness_script]
+      self.assertTrue(tx.verify_input(0))
+      # a witness script that does not parse fails instead of raising
+      tx.tx_ins[0].witness = [b'\x4c']
+      self.assertFalse(tx.verify_input(0))
+      self.assertFalse(tx.verify())
+      self.assertFalse(tx.verify(batch=True))
+    finally:
+      del TxFetcher.cache[prev]
+
   def test_is_coinbase(self):
     raw_tx = bytes.fromhex('01000000010000000000000000000000000000000000000000000000000000000000000000ffffffff5e03d71b07254d696e656420627920416e74506f6f6c20626a31312f4542312f4144362f43205914293101fabe6d6d678e2c8c34afc36896e7d9402824ed38e856676ee94bfdb0c6c4bcd8b2e5666a0400000000000000c7270000a5e00e00ffffffff01faf20b58000000001976a914338c84849423992471bffb1a54a8d9b1d69dc28a88ac00000000')
     stream = BytesIO(raw_tx)